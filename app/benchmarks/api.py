@@ -0,0 +1,590 @@
+"""
+APIのエンドポイント毎のスループットとレイテンシ(p50/p95/p99)を計測するベンチマークです。<br>
+認証(verify_token)はスタブに置き換え、DBは--database-urlで指定します(SQLiteのファイルも可)。<br>
+--urlを指定しない場合はmain.appをプロセス内(ASGI)で、指定した場合は起動中のuvicornを計測します。
+結果はエンドポイント(メソッドとパスのテンプレート)をキーとするJSONで出力し、
+compareでコミット間の結果を比較できます。
+
+実行方法:
+    python -m benchmarks.api seed --database-url sqlite:///bench.db --users 100 --todos 10000
+    python -m benchmarks.api run --database-url sqlite:///bench.db --output before.json
+    python -m benchmarks.api serve --database-url sqlite:///bench.db --port 8000
+    python -m benchmarks.api run --database-url sqlite:///bench.db \\
+        --url http://127.0.0.1:8000 --output uvicorn.json
+    python -m benchmarks.api compare before.json after.json
+
+--writesを指定した場合は、作成・更新・削除のエンドポイントも計測します。DBの内容が変わるため、
+比較する計測の前にはseedで作り直します。
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import random
+import subprocess
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from itertools import count
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional
+from uuid import UUID, uuid4
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import insert
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, create_engine, func, select
+
+from benchmarks.seed import WORDS, make_todos, seed
+from benchmarks.stats import summarize
+from models.todo import Todo
+from models.user import User
+
+API_PREFIX = "/api/v1"
+ADMIN_PREFIX = "/admin"
+
+
+class BenchmarkRequest(NamedTuple):
+    method: str
+    url: str
+    json: Any = None
+
+
+class Fixture:
+    """
+    リクエストの作成に使用する、DBのユーザー・Todoのidです。<br>
+    更新・削除のリクエスト用の行は、計測の前にDBへ直接作成します。
+    """
+
+    def __init__(self, engine: Engine, seed: int = 0) -> None:
+        self.engine = engine
+        self.rng = random.Random(seed)
+        self.serial = count()
+        with Session(engine) as session:
+            self.user_ids: List[UUID] = list(
+                session.exec(select(User.id).order_by(User.created_at).limit(100))
+            )
+            self.todo_ids: List[UUID] = list(
+                session.exec(select(Todo.id).order_by(Todo.created_at).limit(100))
+            )
+            self.todos = session.exec(select(func.count()).select_from(Todo)).one()
+            self.users = session.exec(select(func.count()).select_from(User)).one()
+        if not self.user_ids or not self.todo_ids:
+            raise SystemExit("ユーザーとTodoがありません。先にseedを実行してください")
+
+    def user_id(self) -> UUID:
+        return self.rng.choice(self.user_ids)
+
+    def todo_id(self) -> UUID:
+        return self.rng.choice(self.todo_ids)
+
+    def unique(self) -> int:
+        return next(self.serial)
+
+    def create_users(self, size: int) -> List[UUID]:
+        """
+        Todoを持たないユーザーをsize件作成します。
+        """
+        rows = []
+        for _ in range(size):
+            serial = f"{uuid4().hex[:12]}"
+            rows.append(
+                {
+                    "id": uuid4(),
+                    "name": f"bench{serial}",
+                    "email": f"bench{serial}@example.com",
+                }
+            )
+        with Session(self.engine) as session:
+            session.execute(insert(User), rows)
+            session.commit()
+        return [row["id"] for row in rows]
+
+    def create_todos(self, size: int, assignee_id: Optional[UUID] = None) -> List[UUID]:
+        rows = make_todos(self.rng, size, self.user_ids, assignee_id=assignee_id)
+        with Session(self.engine) as session:
+            session.execute(insert(Todo), rows)
+            session.commit()
+        return [row["id"] for row in rows]
+
+
+class Scenario(NamedTuple):
+    # 結果のキー。コミット間で比較できるよう、メソッドとパスのテンプレートにする
+    name: str
+    build: Callable[[Fixture, int], List[BenchmarkRequest]]
+    writes: bool = False
+
+
+def repeat(
+    method: str, make_url: Callable[[Fixture], str], make_json: Any = None
+) -> Callable[[Fixture, int], List[BenchmarkRequest]]:
+    def build(fixture: Fixture, size: int) -> List[BenchmarkRequest]:
+        return [
+            BenchmarkRequest(
+                method,
+                make_url(fixture),
+                make_json(fixture) if callable(make_json) else make_json,
+            )
+            for _ in range(size)
+        ]
+
+    return build
+
+
+def delete_todos_by_assignee(fixture: Fixture, size: int) -> List[BenchmarkRequest]:
+    # 1リクエストで10件削除する担当者を、リクエスト毎に用意する
+    requests = []
+    for assignee_id in fixture.create_users(size):
+        fixture.create_todos(10, assignee_id=assignee_id)
+        requests.append(
+            BenchmarkRequest("DELETE", f"{API_PREFIX}/todos?assignee_id={assignee_id}")
+        )
+    return requests
+
+
+SCENARIOS = [
+    Scenario(
+        "GET /api/v1/todos",
+        repeat("GET", lambda f: f"{API_PREFIX}/todos?limit=100"),
+    ),
+    Scenario(
+        "GET /api/v1/todos/export",
+        repeat("GET", lambda f: f"{API_PREFIX}/todos/export?assignee_id={f.user_id()}"),
+    ),
+    Scenario(
+        "GET /api/v1/todos/search",
+        repeat("GET", lambda f: f"{API_PREFIX}/todos/search?q={f.rng.choice(WORDS)}"),
+    ),
+    Scenario(
+        "GET /api/v1/todos/{id}",
+        repeat("GET", lambda f: f"{API_PREFIX}/todos/{f.todo_id()}"),
+    ),
+    Scenario(
+        "GET /api/v1/users",
+        repeat("GET", lambda f: f"{API_PREFIX}/users?limit=100"),
+    ),
+    Scenario(
+        "GET /api/v1/users/{id}",
+        repeat("GET", lambda f: f"{API_PREFIX}/users/{f.user_id()}"),
+    ),
+    Scenario(
+        "GET /api/v1/users/{user_id}/todos",
+        repeat("GET", lambda f: f"{API_PREFIX}/users/{f.user_id()}/todos"),
+    ),
+    Scenario(
+        "GET /api/v1/board",
+        repeat("GET", lambda f: f"{API_PREFIX}/board"),
+    ),
+    Scenario(
+        "GET /api/v1/board/counts",
+        repeat("GET", lambda f: f"{API_PREFIX}/board/counts"),
+    ),
+    Scenario(
+        "GET /api/v1/models/{id}",
+        repeat("GET", lambda f: f"{API_PREFIX}/models/alexnet"),
+    ),
+    Scenario(
+        "GET /admin/users",
+        repeat("GET", lambda f: f"{ADMIN_PREFIX}/users?limit=100"),
+    ),
+    Scenario(
+        "GET /admin/users/{id}",
+        repeat("GET", lambda f: f"{ADMIN_PREFIX}/users/{f.user_id()}"),
+    ),
+    Scenario(
+        "GET /admin/users/{user_id}/todos",
+        repeat("GET", lambda f: f"{ADMIN_PREFIX}/users/{f.user_id()}/todos"),
+    ),
+    Scenario(
+        "GET /admin/cache/stats",
+        repeat("GET", lambda f: f"{ADMIN_PREFIX}/cache/stats"),
+    ),
+    Scenario(
+        "GET /admin/database/pool",
+        repeat("GET", lambda f: f"{ADMIN_PREFIX}/database/pool"),
+    ),
+    Scenario(
+        "POST /api/v1/todos",
+        repeat(
+            "POST",
+            lambda f: f"{API_PREFIX}/todos",
+            lambda f: {"title": f"bench{f.unique()}", "assignee_id": str(f.user_id())},
+        ),
+        writes=True,
+    ),
+    Scenario(
+        "POST /api/v1/todos:bulk",
+        repeat(
+            "POST",
+            lambda f: f"{API_PREFIX}/todos:bulk",
+            lambda f: [{"title": f"bench{f.unique()}"} for _ in range(100)],
+        ),
+        writes=True,
+    ),
+    Scenario(
+        "PATCH /api/v1/todos",
+        repeat(
+            "PATCH",
+            lambda f: f"{API_PREFIX}/todos?assignee_id={f.user_id()}",
+            lambda f: {"status": f.rng.randint(1, 3)},
+        ),
+        writes=True,
+    ),
+    Scenario(
+        "PATCH /api/v1/todos/{id}",
+        repeat(
+            "PATCH",
+            lambda f: f"{API_PREFIX}/todos/{f.todo_id()}",
+            lambda f: {"status": f.rng.randint(1, 3), "title": f"bench{f.unique()}"},
+        ),
+        writes=True,
+    ),
+    Scenario("DELETE /api/v1/todos", delete_todos_by_assignee, writes=True),
+    Scenario(
+        "DELETE /api/v1/todos/{id}",
+        lambda f, size: [
+            BenchmarkRequest("DELETE", f"{API_PREFIX}/todos/{id}")
+            for id in f.create_todos(size)
+        ],
+        writes=True,
+    ),
+    Scenario(
+        "POST /api/v1/users",
+        repeat(
+            "POST",
+            lambda f: f"{API_PREFIX}/users",
+            lambda f: {
+                "name": f"bench{f.unique()}",
+                "email": f"bench-{uuid4().hex}@example.com",
+            },
+        ),
+        writes=True,
+    ),
+    Scenario(
+        "POST /api/v1/users:bulk",
+        repeat(
+            "POST",
+            lambda f: f"{API_PREFIX}/users:bulk",
+            lambda f: [
+                {
+                    "name": f"bench{f.unique()}",
+                    "email": f"bench-{uuid4().hex}@example.com",
+                }
+                for _ in range(100)
+            ],
+        ),
+        writes=True,
+    ),
+    Scenario(
+        "PATCH /api/v1/users/{id}",
+        repeat(
+            "PATCH",
+            lambda f: f"{API_PREFIX}/users/{f.user_id()}",
+            lambda f: {"name": f"bench{f.unique()}"},
+        ),
+        writes=True,
+    ),
+    Scenario(
+        "DELETE /api/v1/users/{id}",
+        lambda f, size: [
+            BenchmarkRequest("DELETE", f"{API_PREFIX}/users/{id}")
+            for id in f.create_users(size)
+        ],
+        writes=True,
+    ),
+    Scenario(
+        "POST /admin/users",
+        repeat(
+            "POST",
+            lambda f: f"{ADMIN_PREFIX}/users",
+            lambda f: {
+                "name": f"bench{f.unique()}",
+                "email": f"bench-{uuid4().hex}@example.com",
+            },
+        ),
+        writes=True,
+    ),
+    Scenario(
+        "POST /admin/users:bulk",
+        repeat(
+            "POST",
+            lambda f: f"{ADMIN_PREFIX}/users:bulk",
+            lambda f: [
+                {
+                    "name": f"bench{f.unique()}",
+                    "email": f"bench-{uuid4().hex}@example.com",
+                }
+                for _ in range(100)
+            ],
+        ),
+        writes=True,
+    ),
+    Scenario(
+        "PATCH /admin/users/{id}",
+        repeat(
+            "PATCH",
+            lambda f: f"{ADMIN_PREFIX}/users/{f.user_id()}",
+            lambda f: {"name": f"bench{f.unique()}"},
+        ),
+        writes=True,
+    ),
+    Scenario(
+        "DELETE /admin/users/{id}",
+        lambda f, size: [
+            BenchmarkRequest("DELETE", f"{ADMIN_PREFIX}/users/{id}")
+            for id in f.create_users(size)
+        ],
+        writes=True,
+    ),
+    Scenario(
+        "POST /admin/todo-counts:reconcile",
+        repeat("POST", lambda f: f"{ADMIN_PREFIX}/todo-counts:reconcile"),
+        writes=True,
+    ),
+]
+
+
+def make_engine(database_url: str) -> Engine:
+    if database_url.startswith("sqlite"):
+        # uvicornのスレッドプールから同じSQLiteのファイルを使用する
+        return create_engine(database_url, connect_args={"check_same_thread": False})
+    return create_engine(database_url)
+
+
+@contextmanager
+def benchmark_app(engine: Engine) -> Iterator[FastAPI]:
+    """
+    セッションをengineに接続し、認証をスタブに置き換えたmain.appを返します。<br>
+    /adminにマウントしたadmin_apiは依存関係の上書きを共有しないため、同様に上書きします。
+    """
+    from dependencies.authorization import verify_token
+    from dependencies.database import get_session
+    from main import admin_api, app
+
+    def get_benchmark_session():
+        with Session(engine, expire_on_commit=False) as session:
+            yield session
+
+    apps = [app, admin_api]
+    overrides = [dict(target.dependency_overrides) for target in apps]
+    for target in apps:
+        target.dependency_overrides[get_session] = get_benchmark_session
+        target.dependency_overrides[verify_token] = lambda: None
+    try:
+        yield app
+    finally:
+        for target, saved in zip(apps, overrides):
+            target.dependency_overrides.clear()
+            target.dependency_overrides.update(saved)
+
+
+async def run_scenario(
+    client: httpx.AsyncClient, requests: List[BenchmarkRequest], concurrency: int
+) -> Dict[str, float]:
+    """
+    requestsをconcurrency並列で送信し、スループットとレイテンシを集計します。
+    """
+    pending = iter(requests)
+    latencies: List[float] = []
+    errors = 0
+
+    async def worker() -> None:
+        nonlocal errors
+        for request in pending:
+            start = time.perf_counter()
+            response = await client.request(
+                request.method, request.url, json=request.json
+            )
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - start, errors)
+
+
+async def run_scenarios(
+    client: httpx.AsyncClient,
+    fixture: Fixture,
+    scenarios: List[Scenario],
+    requests: int,
+    warmup: int,
+    concurrency: int,
+) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for scenario in scenarios:
+        await run_scenario(client, scenario.build(fixture, warmup), concurrency)
+        results[scenario.name] = await run_scenario(
+            client, scenario.build(fixture, requests), concurrency
+        )
+        print(f"{scenario.name:<40} {format_result(results[scenario.name])}")
+    return results
+
+
+def format_result(result: Dict[str, float]) -> str:
+    return (
+        f"{result['throughput_rps']:>9.1f} req/s "
+        f"p50 {result['p50_ms']:>8.2f}ms p95 {result['p95_ms']:>8.2f}ms "
+        f"p99 {result['p99_ms']:>8.2f}ms errors {result['errors']}"
+    )
+
+
+def git_revision() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(
+            subprocess.run(
+                ["git", "status", "--porcelain", "--untracked-files=no"],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+    return {"commit": commit, "dirty": dirty}
+
+
+def run(
+    engine: Engine,
+    url: Optional[str] = None,
+    requests: int = 200,
+    warmup: int = 20,
+    concurrency: int = 10,
+    writes: bool = False,
+    only: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """
+    シナリオを順に計測し、計測条件と結果を返します。
+    """
+    fixture = Fixture(engine)
+    scenarios = [
+        scenario
+        for scenario in SCENARIOS
+        if (writes or not scenario.writes)
+        and (not only or any(name in scenario.name for name in only))
+    ]
+
+    async def main() -> Dict[str, Dict[str, float]]:
+        limits = httpx.Limits(max_connections=concurrency)
+        if url is not None:
+            async with httpx.AsyncClient(base_url=url, limits=limits) as client:
+                return await run_scenarios(
+                    client, fixture, scenarios, requests, warmup, concurrency
+                )
+        with benchmark_app(engine) as app:
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(
+                transport=transport, base_url="http://benchmark", limits=limits
+            ) as client:
+                return await run_scenarios(
+                    client, fixture, scenarios, requests, warmup, concurrency
+                )
+
+    results = asyncio.run(main())
+    return {
+        "meta": {
+            **git_revision(),
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "target": url or "asgi",
+            "database": engine.dialect.name,
+            "users": fixture.users,
+            "todos": fixture.todos,
+            "requests": requests,
+            "warmup": warmup,
+            "concurrency": concurrency,
+        },
+        "results": results,
+    }
+
+
+def compare(before: Dict[str, Any], after: Dict[str, Any]) -> str:
+    """
+    2つの結果を、両方に含まれるエンドポイント毎にp50・p95・スループットの比で比較します。
+    """
+    lines = [
+        f"before: {before['meta'].get('commit')}  after: {after['meta'].get('commit')}",
+        f"{'endpoint':<40} {'p50':>17} {'p95':>17} {'req/s':>17}",
+    ]
+    for name in sorted(before["results"].keys() & after["results"].keys()):
+        old, new = before["results"][name], after["results"][name]
+        columns = []
+        for key in ["p50_ms", "p95_ms", "throughput_rps"]:
+            ratio = new[key] / old[key] if old[key] else float("nan")
+            columns.append(f"{old[key]:>7.1f}→{new[key]:>7.1f}({ratio:>4.2f}x)")
+        lines.append(f"{name:<40} " + " ".join(columns))
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = commands.add_parser("seed", help="ユーザーとTodoを作成する")
+    seed_parser.add_argument("--database-url", required=True)
+    seed_parser.add_argument("--users", type=int, default=100)
+    seed_parser.add_argument("--todos", type=int, default=10000)
+
+    run_parser = commands.add_parser("run", help="エンドポイント毎に計測する")
+    run_parser.add_argument("--database-url", required=True)
+    run_parser.add_argument("--url", help="起動中のサーバーのURL(省略時はプロセス内)")
+    run_parser.add_argument("--requests", type=int, default=200)
+    run_parser.add_argument("--warmup", type=int, default=20)
+    run_parser.add_argument("--concurrency", type=int, default=10)
+    run_parser.add_argument("--writes", action="store_true")
+    run_parser.add_argument(
+        "--only", nargs="+", help="名前にいずれかを含むエンドポイントだけを計測する"
+    )
+    run_parser.add_argument("--output", help="結果を書き込むJSONファイル")
+
+    serve_parser = commands.add_parser(
+        "serve", help="認証をスタブにしたアプリをuvicornで起動する"
+    )
+    serve_parser.add_argument("--database-url", required=True)
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8000)
+
+    compare_parser = commands.add_parser("compare", help="2つの結果を比較する")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+
+    args = parser.parse_args()
+    if args.command == "compare":
+        with open(args.before) as before, open(args.after) as after:
+            print(compare(json.load(before), json.load(after)))
+        return
+
+    engine = make_engine(args.database_url)
+    if args.command == "seed":
+        seed(engine, args.users, args.todos)
+    elif args.command == "serve":
+        import uvicorn
+
+        with benchmark_app(engine) as app:
+            uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+    else:
+        result = run(
+            engine,
+            url=args.url,
+            requests=args.requests,
+            warmup=args.warmup,
+            concurrency=args.concurrency,
+            writes=args.writes,
+            only=args.only,
+        )
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(result, f, ensure_ascii=False, indent=2, sort_keys=True)
+                f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
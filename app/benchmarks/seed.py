@@ -0,0 +1,126 @@
+"""
+ベンチマーク用のユーザーとTodoを一括で作成します。
+"""
+
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+from uuid import UUID, uuid4
+
+from sqlalchemy import delete, insert
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, SQLModel
+
+from cruds.todo_crud import TodoCRUD
+from models.todo import TaskStatus, Todo, TodoStatusCount
+from models.user import User
+
+# タイトル・説明を組み立てる語
+WORDS = [
+    "会議",
+    "資料",
+    "作成",
+    "議事録",
+    "共有",
+    "印刷",
+    "見積",
+    "請求書",
+    "確認",
+    "レビュー",
+    "デプロイ",
+    "障害",
+    "対応",
+    "調査",
+    "設計",
+    "テスト",
+    "リリース",
+    "顧客",
+    "連絡",
+    "予算",
+    "採用",
+    "面接",
+    "研修",
+    "契約",
+    "更新",
+    "申請",
+    "承認",
+    "報告",
+    "分析",
+    "改善",
+]
+
+# タイトルに含める案件番号の種類。案件番号での検索は一致する行が少ない検索になる
+PROJECTS = 10000
+
+# 作成日時の起点。行毎に1秒ずつずらし、作成日時順を一意にする
+CREATED_AT = datetime(2024, 1, 1)
+
+
+def make_text(rng: random.Random, words: int) -> str:
+    return "の".join(rng.choice(WORDS) for _ in range(words))
+
+
+def make_todos(
+    rng: random.Random,
+    size: int,
+    user_ids: List[UUID],
+    start: int = 0,
+    assignee_id: Optional[UUID] = None,
+) -> List[Dict[str, Any]]:
+    """
+    INSERTするTodoの行をsize件作成します。担当者・作成者・更新者はuser_idsから順に割り当てます。
+    """
+    statuses = list(TaskStatus)
+    rows = []
+    for i in range(start, start + size):
+        created_at = CREATED_AT + timedelta(seconds=i)
+        user_id = user_ids[i % len(user_ids)] if user_ids else None
+        rows.append(
+            {
+                "id": uuid4(),
+                "title": f"{make_text(rng, 3)}(案件{rng.randrange(PROJECTS)})",
+                "description": make_text(rng, 20),
+                "status": statuses[i % len(statuses)],
+                "assignee_id": assignee_id or user_id,
+                "creator_id": user_id,
+                "updater_id": user_id,
+                "created_at": created_at,
+                "updated_at": created_at,
+            }
+        )
+    return rows
+
+
+def seed(engine: Engine, users: int, todos: int, batch_size: int = 10000) -> None:
+    """
+    テーブルを作成して既存の行を削除し、ユーザーをusers件・Todoをtodos件作成します。<br>
+    ステータス・担当者毎の件数は、作成後に集計し直します。
+    """
+    rng = random.Random(0)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        for model in [TodoStatusCount, Todo, User]:
+            session.execute(delete(model))
+        user_ids = [uuid4() for _ in range(users)]
+        for start in range(0, users, batch_size):
+            session.execute(
+                insert(User),
+                [
+                    {
+                        "id": user_ids[i],
+                        "name": f"user{i}",
+                        "email": f"user{i}@example.com",
+                        "created_at": CREATED_AT + timedelta(seconds=i),
+                        "updated_at": CREATED_AT + timedelta(seconds=i),
+                    }
+                    for i in range(start, min(start + batch_size, users))
+                ],
+            )
+        for start in range(0, todos, batch_size):
+            size = min(batch_size, todos - start)
+            session.execute(insert(Todo), make_todos(rng, size, user_ids, start))
+            session.commit()
+            print(f"seeded {start + size}/{todos} todos", end="\r")
+        print()
+        session.commit()
+        TodoCRUD(session).reconcile_status_counts()
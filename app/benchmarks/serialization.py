@@ -0,0 +1,86 @@
+"""
+一覧レスポンスのシリアライズ方法を比較するベンチマークです。<br>
+default: response_modelによる検証とJSONResponseでのシリアライズ(FastAPIの標準の経路)<br>
+fast: 事前に作成したTypeAdapterでの検証とdump_jsonによるシリアライズ
+(settings.fast_json_responseが有効な場合の経路)
+
+実行方法: python -m benchmarks.serialization [--sizes 100 1000] [--repeat 20]
+"""
+
+import argparse
+import asyncio
+import gc
+import time
+from statistics import median
+from typing import Callable, List
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from dependencies.fields import todo_fields
+from models.todo import TaskStatus, Todo, TodoReadSchema
+from models.user import User
+
+
+def make_todos(size: int) -> List[Todo]:
+    """
+    DBを使わずに、担当者・作成者・更新者を持つTodoをsize件作成します。
+    """
+    users = [User(name=f"user{i}", email=f"user{i}@example.com") for i in range(10)]
+    statuses = list(TaskStatus)
+    return [
+        Todo(
+            title=f"todo{i}",
+            description="ベンチマーク用のTodoです。" * 5,
+            status=statuses[i % len(statuses)],
+            assignee=users[i % len(users)],
+            creator=users[(i + 1) % len(users)],
+            updater=users[(i + 2) % len(users)],
+        )
+        for i in range(size)
+    ]
+
+
+response_field = create_response_field(name="Response", type_=List[TodoReadSchema])
+
+
+def render_default(todos: List[Todo]) -> bytes:
+    content = asyncio.run(
+        serialize_response(field=response_field, response_content=todos)
+    )
+    return JSONResponse(content).body
+
+
+def render_fast(todos: List[Todo]) -> bytes:
+    adapter = todo_fields.adapters[True]
+    return adapter.dump_json(adapter.validate_python(todos, from_attributes=True))
+
+
+def measure(render: Callable[[List[Todo]], bytes], todos: List[Todo], repeat: int):
+    render(todos)
+    gc.collect()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        render(todos)
+        timings.append(time.perf_counter() - start)
+    return median(timings) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'size':>6} {'default(ms)':>12} {'fast(ms)':>10} {'speedup':>8}")
+    for size in args.sizes:
+        todos = make_todos(size)
+        default = measure(render_default, todos, args.repeat)
+        fast = measure(render_fast, todos, args.repeat)
+        print(f"{size:>6} {default:>12.2f} {fast:>10.2f} {default / fast:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
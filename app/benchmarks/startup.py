@@ -0,0 +1,78 @@
+"""
+ワーカーの起動時にかかるimportの時間を計測するベンチマークです。<br>
+python -X importtimeの出力を集計し、累積時間の大きいモジュールを表示します。
+
+実行方法: python -m benchmarks.startup [--module main] [--repeat 5] [--top 20]
+"""
+
+import argparse
+import subprocess
+import sys
+from os.path import abspath, dirname
+from typing import Dict, List, Tuple
+
+# appディレクトリ。importするモジュールはここから解決する
+APP_DIR = dirname(dirname(abspath(__file__)))
+
+
+def parse_importtime(output: str) -> Dict[str, Tuple[int, int]]:
+    """
+    -X importtimeの出力を、{モジュール: (自身の時間, 累積時間)}(マイクロ秒)に変換します。
+    """
+    times: Dict[str, Tuple[int, int]] = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        if not self_us.strip().isdigit():
+            # 見出しの行
+            continue
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def import_times(module: str = "main") -> Dict[str, Tuple[int, int]]:
+    """
+    新しいプロセスでmoduleをimportし、各モジュールのimportの時間を返します。
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=APP_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return parse_importtime(result.stderr)
+
+
+def measure(module: str, repeat: int) -> Dict[str, Tuple[int, int]]:
+    """
+    repeat回importし、moduleの累積時間が最も短かった回の結果を返します。<br>
+    初回はバイトコードのコンパイルやディスクの読み込みを含むため、最小値を使用します。
+    """
+    runs = [import_times(module) for _ in range(repeat)]
+    return min(runs, key=lambda times: times[module][1])
+
+
+def format_report(times: Dict[str, Tuple[int, int]], module: str, top: int) -> str:
+    lines: List[str] = [f"{module}: {times[module][1] / 1000:.1f}ms"]
+    lines.append(f"{'cumulative(ms)':>15} {'self(ms)':>9}  module")
+    for name, (self_us, cumulative_us) in sorted(
+        times.items(), key=lambda item: -item[1][1]
+    )[:top]:
+        lines.append(f"{cumulative_us / 1000:>15.1f} {self_us / 1000:>9.1f}  {name}")
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    print(format_report(measure(args.module, args.repeat), args.module, args.top))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+"""
+ベンチマークの計測結果を集計します。
+"""
+
+from typing import Dict, List
+
+
+def percentile(timings: List[float], p: float) -> float:
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def summarize(
+    latencies_ms: List[float], elapsed_seconds: float, errors: int = 0
+) -> Dict[str, float]:
+    """
+    リクエスト毎のレイテンシ(ミリ秒)と全体の経過時間から、
+    スループットとp50/p95/p99を計算します。値はコミット間で比較できるよう丸めます。
+    """
+    return {
+        "requests": len(latencies_ms),
+        "errors": errors,
+        "throughput_rps": round(len(latencies_ms) / elapsed_seconds, 1),
+        "mean_ms": round(sum(latencies_ms) / len(latencies_ms), 3),
+        "p50_ms": round(percentile(latencies_ms, 0.50), 3),
+        "p95_ms": round(percentile(latencies_ms, 0.95), 3),
+        "p99_ms": round(percentile(latencies_ms, 0.99), 3),
+    }
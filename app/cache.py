@@ -0,0 +1,117 @@
+import asyncio
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Protocol
+
+
+class CacheBackend(Protocol):
+    """
+    キャッシュのバックエンドが実装するインターフェースです。<br>
+    TTLCacheの代わりに、プロセス間で共有できるバックエンドなどに差し替えられます。
+    """
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """キーの値を返します。無い場合や期限切れの場合はdefaultを返します。"""
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """値を保存します。ttlを省略した場合はバックエンドの既定値を使用します。"""
+
+    def delete(self, key: Hashable) -> None:
+        """キーの値を削除します。"""
+
+    def clear(self) -> None:
+        """全ての値を削除します。"""
+
+    def stats(self) -> dict:
+        """ヒット・ミス・破棄の件数などの統計を返します。"""
+
+
+class TTLCache:
+    """
+    件数上限付きのTTLキャッシュです。<br>
+    上限を超えた場合は最も長く参照されていないエントリから破棄します(LRU)。<br>
+    複数スレッドから利用できるように、操作はロックで保護しています。
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        timer: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            expires_at, value = item
+            if expires_at <= self.timer():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = self.timer() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class SingleFlight:
+    """
+    同じキーの処理が実行中の場合、新たに実行せずその結果を共有します。<br>
+    同時に届いた同一トークンのリクエストなどで、外部への問い合わせを1回にまとめます。
+    """
+
+    def __init__(self) -> None:
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn())
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        # 待機側がキャンセルされても、他の待機側の処理は継続させる
+        return await asyncio.shield(future)
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
@@ -1,5 +1,6 @@
-from typing import List
+from typing import List, Literal
 
+from pydantic import model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -9,15 +10,57 @@ class Settings(BaseSettings):
     db_name: str
     db_user: str
     db_password: str
+    db_async: bool = False
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30
+    # MySQLのwait_timeout(既定8時間)より短くし、切断された接続を使わないようにする
+    db_pool_recycle: int = 3600
+    db_pool_pre_ping: bool = True
+    # 参照用のレプリカのURL(mysql+pymysql://...)。指定しない場合は全てプライマリを使用する
+    db_replica_urls: List[str] = []
+    db_replica_health_check_interval: float = 10
+    # 更新後にこの秒数の間は、同じクライアントの参照をプライマリで行う
+    read_your_writes_seconds: int = 5
+    bulk_batch_size: int = 500
+    export_yield_per: int = 1000
+    fast_json_response: bool = False
+    entity_cache_enabled: bool = False
+    entity_cache_maxsize: int = 10000
+    entity_cache_ttl: float = 30
+    query_plan_advisor: bool = False
+    server_timing: bool = True
+    slow_query_seconds: float = 0.5
+    # mainのimportにかかる時間の上限(tests/test_startup.pyで検証する)
+    import_time_budget_seconds: float = 1.5
     customer_side_user_pool_id: str
+    auth_mode: Literal["cognito", "jwt"] = "cognito"
+    cognito_app_client_ids: List[str] = []
+    jwks_refresh_interval: float = 3600
+    auth_cache_maxsize: int = 1024
+    auth_cache_ttl: float = 60
+    auth_cache_negative_ttl: float = 10
     allowed_domains: List[str] = ["http://localhost:3000"]
     model_config = SettingsConfigDict(
         env_file=".env", env_file_encoding="utf-8", extra="ignore"
     )
 
+    @model_validator(mode="after")
+    def check_app_client_ids(self) -> "Settings":
+        # ローカル検証ではclient_idを必ず検証し、同じユーザープールの他のアプリのトークンを拒否する
+        if self.auth_mode == "jwt" and not self.cognito_app_client_ids:
+            raise ValueError(
+                "AUTH_MODE=jwtの場合はCOGNITO_APP_CLIENT_IDSを指定してください"
+            )
+        return self
+
     @property
     def database_url(self) -> str:
         return f"mysql+pymysql://{self.db_user}:{self.db_password}@{self.db_host}/{self.db_name}?charset=utf8mb4"  # noqa: E501
 
+    @property
+    def async_database_url(self) -> str:
+        return f"mysql+aiomysql://{self.db_user}:{self.db_password}@{self.db_host}/{self.db_name}?charset=utf8mb4"  # noqa: E501
+
 
 settings = Settings()
@@ -1,51 +1,610 @@
-from typing import Generic, Type, TypeVar
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Generic,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
 from uuid import UUID
 
 from fastapi import HTTPException, status
-from sqlmodel import Session, SQLModel
+from fastapi.concurrency import iterate_in_threadpool, run_in_threadpool
+from pydantic import ValidationError
+from sqlalchemy import delete, func, insert, inspect, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlmodel import Session, SQLModel, and_, or_
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel.sql.expression import SelectOfScalar
 
-from models import BaseCreateSchema, BaseUpdateSchema
+from cache import CacheBackend, TTLCache
+from config import settings
+from models import BaseCreateSchema, BaseUpdateSchema, BulkItemResult
 
 ModelType = TypeVar("ModelType", bound=SQLModel)
 
 CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseCreateSchema)
 UpdateSchemaType = TypeVar("UpdateSchemaType", bound=BaseUpdateSchema)
 
+# 一覧APIで次ページのカーソルを返すレスポンスヘッダー
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# レプリカに接続したセッションであることを示す、Session.infoのキー。
+# レプリカの値は更新から遅れている場合があるため、キャッシュに書き込まない
+REPLICA_SESSION_INFO = "replica"
+
+
+def encode_cursor(obj: SQLModel) -> str:
+    """
+    オブジェクトの(created_at, id)を、一覧の次ページを取得するためのカーソルに変換します。
+    """
+    value = json.dumps([obj.created_at.isoformat(), str(obj.id)])
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    try:
+        created_at, id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), UUID(id)
+    except (binascii.Error, TypeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
+
 
 class CRUD(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
 
+    # getで一緒に読み込むリレーションのローダーオプション
+    load_options: Sequence[Any] = ()
+
+    # bulk_createで各要素の検証に使用するスキーマ
+    create_schema: Type[CreateSchemaType]
+
+    # get_cached・all_cachedでキャッシュに保持するスキーマ
+    read_schema: Type[SQLModel]
+
+    # settings.entity_cache_enabledが有効な場合に、読み込んだエンティティを保持するキャッシュ。
+    # 他のCacheBackendを代入することで差し替えられる
+    cache: CacheBackend = TTLCache(
+        maxsize=settings.entity_cache_maxsize, ttl=settings.entity_cache_ttl
+    )
+
+    # 書き込み時に、親のキャッシュを無効化するために読み込む列
+    parent_columns: Sequence[str] = ()
+
+    # 書き込み時に、update_countersで集計を更新するために読み込む列
+    counter_columns: Sequence[str] = ()
+
     def __init__(self, model: Type[ModelType], session: Session) -> None:
         self.model = model
         self.session = session
 
+    def cache_key(self, id: UUID) -> Hashable:
+        return (self.model.__tablename__, id)
+
+    def parent_cache_keys(self, row: Mapping[str, Any]) -> List[Hashable]:
+        """
+        rowの行を書き込んだ際に無効化する、親のキャッシュのキーを返します。<br>
+        rowにはidとparent_columnsの値が含まれます。
+        """
+        return []
+
+    def embedded_cache_keys(self, where: Sequence[Any]) -> List[Hashable]:
+        """
+        whereの行を埋め込んでいる、他のエンティティのキャッシュのキーを返します。<br>
+        削除で外部キーがNULLになるなど、書き込みで埋め込み先が変わる場合があるため
+        書き込みの前に呼び出します。
+        """
+        return []
+
+    def _embedded_cache_keys(self, where: Sequence[Any]) -> List[Hashable]:
+        if not settings.entity_cache_enabled:
+            return []
+        return self.embedded_cache_keys(where)
+
+    def update_counters(
+        self,
+        old_rows: Iterable[Mapping[str, Any]],
+        new_rows: Iterable[Mapping[str, Any]],
+    ) -> None:
+        """
+        書き込みの前の行(old_rows)と後の行(new_rows)から、集計を更新します。<br>
+        行にはidとparent_columns・counter_columnsの値が含まれます。
+        書き込みと同じトランザクションで、コミットの前に呼び出します。
+        """
+
+    def _counts_changed(self, values: Mapping[str, Any]) -> bool:
+        return any(name in values for name in self.counter_columns)
+
+    @property
+    def _row_columns(self) -> List[str]:
+        return list(dict.fromkeys(("id", *self.parent_columns, *self.counter_columns)))
+
+    def _written_row(self, obj: ModelType) -> Dict[str, Any]:
+        return {name: getattr(obj, name) for name in self._row_columns}
+
+    def _written_rows(
+        self, where: Sequence[Any], lock: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        これから更新・削除する行のidと親・集計の列を取得します。<br>
+        lockがTrueの場合は、集計を更新し終えるまで他の書き込みで変更されないよう行をロックします。
+        キャッシュが無効でlockがFalseの場合は取得しません。
+        """
+        if not settings.entity_cache_enabled and not lock:
+            return []
+        columns = [getattr(self.model, name) for name in self._row_columns]
+        statement = select(*columns).where(*where)
+        if lock:
+            statement = statement.with_for_update()
+        result = self.session.execute(statement)
+        return [dict(row) for row in result.mappings()]
+
+    def invalidate(
+        self, rows: Iterable[Mapping[str, Any]], keys: Iterable[Hashable] = ()
+    ) -> None:
+        """
+        書き込んだ行と、その親のキャッシュを削除します。コミット後に呼び出します。<br>
+        keysには、書き込みの前にembedded_cache_keysで取得したキーを指定します。
+        """
+        if not settings.entity_cache_enabled:
+            return
+        for row in rows:
+            self.cache.delete(self.cache_key(row["id"]))
+            for key in self.parent_cache_keys(row):
+                self.cache.delete(key)
+        for key in keys:
+            self.cache.delete(key)
+
     def create(self, obj_in: CreateSchemaType) -> ModelType:
         object = self.model.model_validate(obj_in)
 
+        row = self._written_row(object)
+        # 全ての列の値(idや作成・更新日時を含む)はクライアントで生成しているため、
+        # コミット後にrefreshで読み込み直さない
+        values = {
+            column.key: getattr(object, column.key)
+            for column in inspect(self.model).column_attrs
+        }
         self.session.add(object)
+        self.update_counters([], [row])
         self.session.commit()
-        self.session.refresh(object)
+        # expire_on_commitのセッションでは、コミットで破棄された値を読み込み済みの値として戻す
+        if self.session.expire_on_commit:
+            for key, value in values.items():
+                set_committed_value(object, key, value)
+        self.invalidate([row])
         return object
 
-    def get(self, id: UUID) -> ModelType:
-        obj = self.session.get(self.model, id)
+    def bulk_create(
+        self, objs_in: Sequence[Mapping[str, Any]], batch_size: int
+    ) -> List[BulkItemResult]:
+        """
+        複数のオブジェクトを1つのトランザクションで作成します。<br>
+        batch_size件ずつexecutemanyでINSERTし、作成後のrefreshは行いません。<br>
+        検証エラーやDBの制約違反となった要素はerrorsに理由を返し、他の要素は作成します。
+        """
+        results: List[BulkItemResult] = []
+        rows: List[Tuple[int, Dict[str, Any]]] = []
+        for index, obj_in in enumerate(objs_in):
+            try:
+                object = self.model.model_validate(
+                    self.create_schema.model_validate(obj_in)
+                )
+            except ValidationError as e:
+                errors = e.errors(
+                    include_url=False, include_context=False, include_input=False
+                )
+                results.append(BulkItemResult(index=index, errors=errors))
+                continue
+            rows.append((index, object.model_dump()))
+            results.append(BulkItemResult(index=index, id=object.id))
+
+        inserted: List[Dict[str, Any]] = []
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start : start + batch_size]
+            try:
+                with self.session.begin_nested():
+                    self.session.execute(insert(self.model), [row for _, row in batch])
+                inserted.extend(row for _, row in batch)
+            except IntegrityError:
+                # 制約違反となった要素を特定するため、バッチ内を1件ずつ作成し直す
+                for index, row in batch:
+                    try:
+                        with self.session.begin_nested():
+                            self.session.execute(insert(self.model), [row])
+                        inserted.append(row)
+                    except IntegrityError:
+                        results[index] = BulkItemResult(
+                            index=index,
+                            errors=[
+                                {
+                                    "type": "integrity_error",
+                                    "msg": "Integrity constraint violated",
+                                }
+                            ],
+                        )
+        self.update_counters([], inserted)
+        self.session.commit()
+        self.invalidate(inserted)
+        return results
+
+    def get(self, id: UUID, options: Optional[Sequence[Any]] = None) -> ModelType:
+        if options is None:
+            options = self.load_options
+        obj = self.session.get(self.model, id, options=options)
         if not obj:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Object not found"
             )
         return obj
 
-    def update(self, id: UUID, update_data: UpdateSchemaType) -> ModelType:
+    @property
+    def _caches_reads(self) -> bool:
+        # 更新の直後にレプリカの古い値をキャッシュに戻すと、更新したクライアントの参照を
+        # プライマリで行ってもキャッシュから古い値を返してしまうため、プライマリの値だけを保持する
+        return not self.session.info.get(REPLICA_SESSION_INFO, False)
+
+    def get_cached(self, id: UUID) -> Union[ModelType, SQLModel]:
+        """
+        read_schemaに変換したオブジェクトをキャッシュから返し、無い場合はDBから取得します。<br>
+        キャッシュが無効な場合はgetと同じです。レプリカのセッションで読み込んだ値はキャッシュしません。<br>
+        書き込み時に本体と親、本体を埋め込んでいるエンティティ(担当者を埋め込んだTodoなど)の
+        キャッシュを削除します。
+        """
+        if not settings.entity_cache_enabled:
+            return self.get(id)
+        key = self.cache_key(id)
+        obj = self.cache.get(key)
+        if obj is None:
+            obj = self.read_schema.model_validate(self.get(id))
+            if self._caches_reads:
+                self.cache.set(key, obj)
+        return obj
+
+    def all(
+        self,
+        statement: SelectOfScalar[ModelType],
+        options: Optional[Sequence[Any]] = None,
+    ) -> List[ModelType]:
+        if options is None:
+            options = self.load_options
+        statement = statement.options(*options)
+        return list(self.session.exec(statement).all())
+
+    def all_cached(
+        self, key: Hashable, statement: SelectOfScalar[ModelType]
+    ) -> List[Union[ModelType, SQLModel]]:
+        """
+        allの結果をread_schemaのリストとしてkeyでキャッシュします。<br>
+        keyはparent_cache_keysで無効化されるキーを指定します。
+        """
+        if not settings.entity_cache_enabled:
+            return self.all(statement)
+        objs = self.cache.get(key)
+        if objs is None:
+            objs = [self.read_schema.model_validate(obj) for obj in self.all(statement)]
+            if self._caches_reads:
+                self.cache.set(key, objs)
+        return objs
+
+    def fingerprint(
+        self, where: Sequence[Any], relationships: Sequence[str] = ()
+    ) -> Tuple[int, ...]:
+        """
+        条件に一致する行の件数とrevisionの合計を、1回の集計クエリで取得します。<br>
+        relationshipsに指定したリレーション(レスポンスに埋め込む関連エンティティ)の
+        revisionの合計も、外部結合して集計します。<br>
+        revisionは書き込み毎に変わるため、同じ秒の更新や関連エンティティの更新でも値が変わります。
+        一覧を読み込まずに、変更の有無(ETag)を判定するために使用します。
+        """
+        columns = [
+            func.count(self.model.id),
+            func.coalesce(func.sum(self.model.revision), 0),
+        ]
+        joins = []
+        for name in relationships:
+            relationship = getattr(self.model, name)
+            related = aliased(relationship.property.mapper.class_)
+            joins.append(relationship.of_type(related))
+            columns.append(func.coalesce(func.sum(related.revision), 0))
+        statement = select(*columns).select_from(self.model)
+        for join in joins:
+            statement = statement.outerjoin(join)
+        row = self.session.execute(statement.where(*where)).one()
+        # MySQLのSUMはDECIMALを返すため、intに揃える
+        return tuple(int(value) for value in row)
+
+    @staticmethod
+    def fingerprint_of(
+        objs: Sequence[SQLModel], relationships: Sequence[str] = ()
+    ) -> Tuple[int, ...]:
+        """
+        読み込み済みのobjsから、fingerprintと同じ値を計算します。
+        """
+        values = [len(objs), sum(obj.revision for obj in objs)]
+        for name in relationships:
+            related = (getattr(obj, name) for obj in objs)
+            values.append(sum(obj.revision for obj in related if obj is not None))
+        return tuple(values)
+
+    def stream(
+        self,
+        statement: SelectOfScalar[ModelType],
+        yield_per: int,
+        options: Optional[Sequence[Any]] = None,
+    ) -> Iterator[List[ModelType]]:
+        """
+        サーバーサイドカーソルで結果を取得し、yield_per件ずつのリストを返します。<br>
+        結果全体をメモリに読み込まないため、件数に関わらず使用メモリは一定です。
+        """
+        if options is None:
+            options = self.load_options
+        statement = statement.options(*options).execution_options(
+            stream_results=True, yield_per=yield_per
+        )
+        yield from self.session.exec(statement).partitions()
+
+    def page(
+        self,
+        statement: SelectOfScalar[ModelType],
+        limit: int,
+        offset: int = 0,
+        cursor: Optional[str] = None,
+        options: Optional[Sequence[Any]] = None,
+    ) -> Tuple[List[ModelType], Optional[str]]:
+        """
+        (created_at, id)順で1ページ分を取得し、次ページのカーソルと共に返します。<br>
+        cursorを指定した場合はその位置から取得(キーセットページネーション)し、
+        指定しない場合はoffsetを使用します。次ページが無い場合カーソルはNoneです。
+        """
+        statement = statement.order_by(self.model.created_at, self.model.id)
+        if cursor is not None:
+            created_at, id = decode_cursor(cursor)
+            statement = statement.where(
+                or_(
+                    self.model.created_at > created_at,
+                    and_(self.model.created_at == created_at, self.model.id > id),
+                )
+            )
+        else:
+            statement = statement.offset(offset)
+        # 次ページの有無を判定するため、1件多く取得する
+        objs = self.all(statement.limit(limit + 1), options)
+        if len(objs) <= limit:
+            return objs, None
+        objs = objs[:limit]
+        return objs, encode_cursor(objs[-1])
+
+    def update(
+        self, id: UUID, update_data: UpdateSchemaType, refresh: bool = True
+    ) -> Optional[ModelType]:
+        """
+        指定したIDのオブジェクトを更新します。<br>
+        refreshがFalseの場合は、事前のSELECTと更新後のrefreshを行わず
+        1回のUPDATEだけで更新し、Noneを返します。更新件数が0件の場合は404とします。
+        """
+        if not refresh:
+            values = update_data.model_dump(exclude_unset=True)
+            # 集計する列を変更しない場合は、事前のSELECTを行わない
+            counted = self._counts_changed(values)
+            rows = self._written_rows([self.model.id == id], lock=counted)
+            embedded = self._embedded_cache_keys([self.model.id == id])
+            result = self.session.execute(
+                update(self.model).where(self.model.id == id).values(**values)
+            )
+            if result.rowcount == 0:
+                self.session.rollback()
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND, detail="Object not found"
+                )
+            new_rows = [{**row, **values} for row in rows]
+            if counted:
+                self.update_counters(rows, new_rows)
+            self.session.commit()
+            # 親が変更された場合は、変更前と変更後の両方の親を無効化する
+            self.invalidate([*rows, *new_rows], embedded)
+            return None
+
         obj = self.get(id)
         model_data = update_data.model_dump(exclude_unset=True)
+        counted = self._counts_changed(model_data)
+        if counted:
+            # 集計の基になる変更前の値は、ロックして読み込み直す
+            old_rows = self._written_rows([self.model.id == id], lock=True)
+        else:
+            old_rows = [self._written_row(obj)]
+        embedded = self._embedded_cache_keys([self.model.id == id])
         for key, value in model_data.items():
             setattr(obj, key, value)
         self.session.add(obj)
+        new_row = self._written_row(obj)
+        if counted:
+            self.update_counters(old_rows, [new_row])
         self.session.commit()
         self.session.refresh(obj)
+        self.invalidate([*old_rows, new_row], embedded)
         return obj
 
+    def update_where(self, where: Sequence[Any], update_data: UpdateSchemaType) -> int:
+        """
+        条件に一致する行を1回のUPDATEで更新し、件数を返します。<br>
+        updated_atはカラムのonupdateにより更新されます。
+        """
+        values = update_data.model_dump(exclude_unset=True)
+        if not values:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="No fields to update"
+            )
+        counted = self._counts_changed(values)
+        rows = self._written_rows(where, lock=counted)
+        embedded = self._embedded_cache_keys(where)
+        statement = update(self.model).where(*where).values(**values)
+        result = self.session.execute(
+            statement, execution_options={"synchronize_session": False}
+        )
+        new_rows = [{**row, **values} for row in rows]
+        if counted:
+            self.update_counters(rows, new_rows)
+        self.session.commit()
+        self.invalidate([*rows, *new_rows], embedded)
+        return result.rowcount
+
+    def delete_where(self, where: Sequence[Any]) -> int:
+        """
+        条件に一致する行を1回のDELETEで削除し、件数を返します。
+        """
+        counted = bool(self.counter_columns)
+        rows = self._written_rows(where, lock=counted)
+        embedded = self._embedded_cache_keys(where)
+        statement = delete(self.model).where(*where)
+        result = self.session.execute(
+            statement, execution_options={"synchronize_session": False}
+        )
+        if counted:
+            self.update_counters(rows, [])
+        self.session.commit()
+        self.invalidate(rows, embedded)
+        return result.rowcount
+
     def delete(self, id: UUID) -> ModelType:
         obj = self.get(id)
+        if self.counter_columns:
+            rows = self._written_rows([self.model.id == id], lock=True)
+        else:
+            rows = [self._written_row(obj)]
+        embedded = self._embedded_cache_keys([self.model.id == id])
         self.session.delete(obj)
+        self.update_counters(rows, [])
         self.session.commit()
+        self.invalidate(rows, embedded)
         return obj
+
+
+class AsyncCRUD(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
+    """
+    CRUDの非同期版です。<br>
+    AsyncSessionの場合はrun_syncで非同期ドライバ上にCRUDの処理を実行し、
+    Sessionの場合はスレッドプールで実行するため、どちらもイベントループをブロックしません。
+    """
+
+    def __init__(
+        self,
+        crud_class: Callable[
+            [Session], CRUD[ModelType, CreateSchemaType, UpdateSchemaType]
+        ],
+        session: Union[Session, AsyncSession],
+    ) -> None:
+        self.crud_class = crud_class
+        self.session = session
+
+    async def _run(self, method: str, *args: Any) -> Any:
+        if isinstance(self.session, AsyncSession):
+            return await self.session.run_sync(
+                lambda session: getattr(self.crud_class(session), method)(*args)
+            )
+        return await run_in_threadpool(
+            getattr(self.crud_class(self.session), method), *args
+        )
+
+    async def create(self, obj_in: CreateSchemaType) -> ModelType:
+        return await self._run("create", obj_in)
+
+    async def bulk_create(
+        self, objs_in: Sequence[Mapping[str, Any]], batch_size: int
+    ) -> List[BulkItemResult]:
+        return await self._run("bulk_create", objs_in, batch_size)
+
+    async def get(self, id: UUID, options: Optional[Sequence[Any]] = None) -> ModelType:
+        return await self._run("get", id, options)
+
+    async def get_cached(self, id: UUID) -> Union[ModelType, SQLModel]:
+        return await self._run("get_cached", id)
+
+    async def all(
+        self,
+        statement: SelectOfScalar[ModelType],
+        options: Optional[Sequence[Any]] = None,
+    ) -> List[ModelType]:
+        return await self._run("all", statement, options)
+
+    async def all_cached(
+        self, key: Hashable, statement: SelectOfScalar[ModelType]
+    ) -> List[Union[ModelType, SQLModel]]:
+        return await self._run("all_cached", key, statement)
+
+    async def fingerprint(
+        self, where: Sequence[Any], relationships: Sequence[str] = ()
+    ) -> Tuple[int, ...]:
+        return await self._run("fingerprint", where, relationships)
+
+    async def stream(
+        self,
+        statement: SelectOfScalar[ModelType],
+        yield_per: int,
+        options: Optional[Sequence[Any]] = None,
+    ) -> AsyncIterator[List[ModelType]]:
+        try:
+            if isinstance(self.session, AsyncSession):
+                if options is None:
+                    options = self.crud_class.load_options
+                result = await self.session.stream_scalars(
+                    statement.options(*options).execution_options(yield_per=yield_per)
+                )
+                async for partition in result.partitions():
+                    yield partition
+            else:
+                partitions = self.crud_class(self.session).stream(
+                    statement, yield_per, options
+                )
+                async for partition in iterate_in_threadpool(partitions):
+                    yield partition
+        finally:
+            # StreamingResponseの送信中は依存関係のセッションが既に閉じられているため、
+            # ストリーミングで開始したトランザクションを終了して接続をプールに返す
+            if isinstance(self.session, AsyncSession):
+                await self.session.rollback()
+            else:
+                await run_in_threadpool(self.session.rollback)
+
+    async def page(
+        self,
+        statement: SelectOfScalar[ModelType],
+        limit: int,
+        offset: int = 0,
+        cursor: Optional[str] = None,
+        options: Optional[Sequence[Any]] = None,
+    ) -> Tuple[List[ModelType], Optional[str]]:
+        return await self._run("page", statement, limit, offset, cursor, options)
+
+    async def update(
+        self, id: UUID, update_data: UpdateSchemaType, refresh: bool = True
+    ) -> Optional[ModelType]:
+        return await self._run("update", id, update_data, refresh)
+
+    async def update_where(
+        self, where: Sequence[Any], update_data: UpdateSchemaType
+    ) -> int:
+        return await self._run("update_where", where, update_data)
+
+    async def delete_where(self, where: Sequence[Any]) -> int:
+        return await self._run("delete_where", where)
+
+    async def delete(self, id: UUID) -> ModelType:
+        return await self._run("delete", id)
@@ -1,10 +1,285 @@
-from sqlmodel import Session
+from collections import Counter
+from typing import (
+    Any,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+from uuid import UUID
 
-from cruds import CRUD
-from models.todo import Todo, TodoCreateSchema, TodoUpdateSchema
+from sqlalchemy import delete, insert
+from sqlalchemy.dialects import mysql
+from sqlalchemy.orm import aliased, joinedload, lazyload
+from sqlmodel import Session, func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from cruds import CRUD, AsyncCRUD
+from models.todo import (
+    UNASSIGNED,
+    TaskStatus,
+    Todo,
+    TodoCreateSchema,
+    TodoReadSchema,
+    TodoStatusCount,
+    TodoUpdateSchema,
+)
+from models.user import User
+from search import InvertedIndex, boolean_query
+
+
+def user_todos_cache_key(user_id: UUID) -> Hashable:
+    """
+    ユーザーの担当Todo一覧のキャッシュのキーです。
+    """
+    return ("user_todos", user_id)
 
 
 class TodoCRUD(CRUD[Todo, TodoCreateSchema, TodoUpdateSchema]):
 
+    # レスポンスで使用する担当者・作成者・更新者をJOINで1回のクエリで読み込む。
+    # 読み込んだUserの各Todo一覧(selectin)はレスポンスで使用しないため読み込まない
+    relationship_loaders = {
+        "assignee": joinedload(Todo.assignee).lazyload("*"),
+        "creator": joinedload(Todo.creator).lazyload("*"),
+        "updater": joinedload(Todo.updater).lazyload("*"),
+    }
+    load_options = (lazyload("*"), *relationship_loaders.values())
+
+    create_schema = TodoCreateSchema
+
+    read_schema = TodoReadSchema
+
+    parent_columns = ("assignee_id",)
+
+    counter_columns = ("status", "assignee_id")
+
+    # MySQL以外でsearchに使用する、タイトル・説明の転置インデックス
+    search_index = InvertedIndex()
+
     def __init__(self, session: Session):
         super().__init__(Todo, session=session)
+
+    def parent_cache_keys(self, row: Mapping[str, Any]) -> List[Hashable]:
+        # 担当者のUser(担当Todo一覧を含む)と、担当Todo一覧のキャッシュを無効化する
+        assignee_id = row.get("assignee_id")
+        if assignee_id is None:
+            return []
+        return [(User.__tablename__, assignee_id), user_todos_cache_key(assignee_id)]
+
+    def invalidate(
+        self, rows: Iterable[Mapping[str, Any]], keys: Iterable[Hashable] = ()
+    ) -> None:
+        # CRUDで書き込んだ場合は、件数とrevisionの合計を比べずに検索用の転置インデックスを作り直す
+        self.search_index.expire()
+        super().invalidate(rows, keys)
+
+    def update_counters(
+        self,
+        old_rows: Iterable[Mapping[str, Any]],
+        new_rows: Iterable[Mapping[str, Any]],
+    ) -> None:
+        # ステータス・担当者の組み合わせ毎の増減をまとめ、変化する組み合わせだけを書き込む
+        deltas: Counter = Counter()
+        for row in old_rows:
+            deltas[(row["status"], row["assignee_id"] or UNASSIGNED)] -= 1
+        for row in new_rows:
+            deltas[(row["status"], row["assignee_id"] or UNASSIGNED)] += 1
+        # デッドロックを避けるため、常に同じ順序でロックする
+        values = [
+            {"status": task_status, "assignee_id": assignee_id, "count": delta}
+            for (task_status, assignee_id), delta in sorted(
+                deltas.items(), key=lambda item: (item[0][0].value, item[0][1])
+            )
+            if delta != 0
+        ]
+        if values:
+            self.session.execute(self._increment_statement(), values)
+
+    def _increment_statement(self) -> Any:
+        """
+        件数の行が無い場合は作成し、ある場合はcountに加算する1つのINSERT文を返します。
+        """
+        table = TodoStatusCount.__table__
+        if self.session.get_bind().dialect.name == "mysql":
+            statement = mysql.insert(table)
+            return statement.on_duplicate_key_update(
+                count=table.c.count + statement.inserted["count"]
+            )
+        # SQLite(テスト・開発環境)の方言は、使用する時に読み込む
+        from sqlalchemy.dialects import sqlite
+
+        statement = sqlite.insert(table)
+        return statement.on_conflict_do_update(
+            index_elements=[table.c.status, table.c.assignee_id],
+            set_={"count": table.c.count + statement.excluded["count"]},
+        )
+
+    def status_counts(self) -> List[Tuple[TaskStatus, Optional[UUID], int]]:
+        """
+        ステータス・担当者毎のTodoの件数を、件数のテーブルから取得します。<br>
+        todoテーブルを集計しないため、Todoの件数に関わらず一定の時間で取得できます。
+        """
+        statement = (
+            select(
+                TodoStatusCount.status,
+                TodoStatusCount.assignee_id,
+                TodoStatusCount.count,
+            )
+            .where(TodoStatusCount.count > 0)
+            .order_by(TodoStatusCount.status, TodoStatusCount.assignee_id)
+        )
+        return [
+            (task_status, None if assignee_id == UNASSIGNED else assignee_id, count)
+            for task_status, assignee_id, count in self.session.exec(statement).all()
+        ]
+
+    def reconcile_status_counts(self) -> int:
+        """
+        件数のテーブルをtodoテーブルの集計から作り直し、件数が異なっていた組み合わせの数を返します。
+        """
+        # 先に件数の行をロックしてから集計する。集計の時点で未コミットの書き込みは、
+        # ロックの解放を待ってから作り直した件数に加算されるため、二重にも漏れにもならない
+        stored: Dict[Tuple[TaskStatus, UUID], int] = {
+            (row.status, row.assignee_id): row.count
+            for row in self.session.exec(
+                select(TodoStatusCount).with_for_update()
+            ).all()
+            if row.count != 0
+        }
+        actual: Dict[Tuple[TaskStatus, UUID], int] = {
+            (task_status, assignee_id or UNASSIGNED): count
+            for task_status, assignee_id, count in self.count_by_status_and_assignee()
+        }
+        self.session.execute(delete(TodoStatusCount))
+        if actual:
+            self.session.execute(
+                insert(TodoStatusCount),
+                [
+                    {"status": task_status, "assignee_id": assignee_id, "count": count}
+                    for (task_status, assignee_id), count in actual.items()
+                ],
+            )
+        self.session.commit()
+        return sum(
+            stored.get(key, 0) != actual.get(key, 0)
+            for key in stored.keys() | actual.keys()
+        )
+
+    def search(
+        self, q: str, where: Sequence[Any], limit: int, offset: int = 0
+    ) -> List[Todo]:
+        """
+        タイトル・説明に検索文字列の全ての語を含むTodoを、関連度の高い順に取得します。<br>
+        MySQLではngramパーサーのFULLTEXTインデックスを使用し、
+        それ以外のDBではプロセス内の転置インデックス(search_index)を使用します。
+        """
+        against = boolean_query(q)
+        if not against:
+            return []
+        if self.session.get_bind().dialect.name == "mysql":
+            score = mysql.match(Todo.title, Todo.description, against=against)
+            score = score.in_boolean_mode()
+            statement = (
+                select(Todo)
+                .where(score, *where)
+                .order_by(score.desc(), Todo.id)
+                .offset(offset)
+                .limit(limit)
+            )
+            return list(self.session.exec(statement.options(*self.load_options)).all())
+
+        ids = self._refresh_search_index().search(q)
+        if ids and where:
+            matched = set(
+                self.session.exec(select(Todo.id).where(Todo.id.in_(ids), *where)).all()
+            )
+            ids = [id for id in ids if id in matched]
+        ids = ids[offset : offset + limit]
+        if not ids:
+            return []
+        todos = {
+            todo.id: todo for todo in self.all(select(Todo).where(Todo.id.in_(ids)))
+        }
+        return [todos[id] for id in ids if id in todos]
+
+    def _refresh_search_index(self) -> InvertedIndex:
+        """
+        Todoの件数とrevisionの合計が変わっている場合は、search_indexを作り直します。
+        """
+        version = self.fingerprint([])
+        if self.search_index.version != version:
+            rows = self.session.exec(select(Todo.id, Todo.title, Todo.description))
+            self.search_index.rebuild(
+                ((id, (title, description)) for id, title, description in rows), version
+            )
+        return self.search_index
+
+    def count_by_status_and_assignee(
+        self,
+    ) -> List[Tuple[TaskStatus, Optional[UUID], int]]:
+        """
+        ステータス・担当者毎のTodoの件数を、1回のGROUP BYで取得します。
+        """
+        statement = (
+            select(Todo.status, Todo.assignee_id, func.count())
+            .group_by(Todo.status, Todo.assignee_id)
+            .order_by(Todo.status, Todo.assignee_id)
+        )
+        return [tuple(row) for row in self.session.exec(statement).all()]
+
+    def first_by_status(self, limit: int) -> List[Todo]:
+        """
+        ステータス毎に作成日時順で先頭limit件のTodoを、
+        ROW_NUMBER()のウィンドウ関数を使用して1回のクエリで取得します。
+        """
+        row_number = (
+            func.row_number()
+            .over(partition_by=Todo.status, order_by=(Todo.created_at, Todo.id))
+            .label("row_number")
+        )
+        ranked = select(Todo, row_number).subquery()
+        card = aliased(Todo, ranked)
+        statement = (
+            select(card)
+            .where(ranked.c.row_number <= limit)
+            .order_by(ranked.c.status, ranked.c.created_at, ranked.c.id)
+            .options(
+                lazyload("*"),
+                *[
+                    joinedload(getattr(card, name)).lazyload("*")
+                    for name in self.relationship_loaders
+                ],
+            )
+        )
+        return list(self.session.exec(statement).all())
+
+
+class TodoAsyncCRUD(AsyncCRUD[Todo, TodoCreateSchema, TodoUpdateSchema]):
+
+    def __init__(self, session: Union[Session, AsyncSession]):
+        super().__init__(TodoCRUD, session=session)
+
+    async def count_by_status_and_assignee(
+        self,
+    ) -> List[Tuple[TaskStatus, Optional[UUID], int]]:
+        return await self._run("count_by_status_and_assignee")
+
+    async def first_by_status(self, limit: int) -> List[Todo]:
+        return await self._run("first_by_status", limit)
+
+    async def search(
+        self, q: str, where: Sequence[Any], limit: int, offset: int = 0
+    ) -> List[Todo]:
+        return await self._run("search", q, where, limit, offset)
+
+    async def status_counts(self) -> List[Tuple[TaskStatus, Optional[UUID], int]]:
+        return await self._run("status_counts")
+
+    async def reconcile_status_counts(self) -> int:
+        return await self._run("reconcile_status_counts")
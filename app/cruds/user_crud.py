@@ -1,10 +1,54 @@
-from sqlmodel import Session
+from typing import Any, Hashable, List, Mapping, Sequence, Union
 
-from cruds import CRUD
+from sqlalchemy.orm import lazyload, selectinload
+from sqlmodel import Session, or_, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from cruds import CRUD, AsyncCRUD
+from cruds.todo_crud import user_todos_cache_key
+from models.todo import Todo, UserReadWithTodosSchema
 from models.user import User, UserCreateSchema, UserUpdateSchema
 
 
 class UserCRUD(CRUD[User, UserCreateSchema, UserUpdateSchema]):
 
+    # レスポンスで使用する担当のTodo一覧だけを読み込み、
+    # 作成・更新したTodo一覧(モデルの既定はselectin)は読み込まない
+    relationship_loaders = {
+        "assigned_todos": selectinload(User.assigned_todos),
+    }
+    load_options = (lazyload("*"), *relationship_loaders.values())
+
+    create_schema = UserCreateSchema
+
+    read_schema = UserReadWithTodosSchema
+
     def __init__(self, session: Session):
         super().__init__(User, session=session)
+
+    def parent_cache_keys(self, row: Mapping[str, Any]) -> List[Hashable]:
+        # 担当Todo一覧の各Todoは、担当者であるこのユーザーを埋め込んでいる
+        return [user_todos_cache_key(row["id"])]
+
+    def embedded_cache_keys(self, where: Sequence[Any]) -> List[Hashable]:
+        # 担当者・作成者・更新者として埋め込んでいるTodoと、その担当者の担当Todo一覧を無効化する
+        user_ids = select(User.id).where(*where)
+        statement = select(Todo.id, Todo.assignee_id).where(
+            or_(
+                Todo.assignee_id.in_(user_ids),
+                Todo.creator_id.in_(user_ids),
+                Todo.updater_id.in_(user_ids),
+            )
+        )
+        keys: List[Hashable] = []
+        for todo_id, assignee_id in self.session.execute(statement):
+            keys.append((Todo.__tablename__, todo_id))
+            if assignee_id is not None:
+                keys.append(user_todos_cache_key(assignee_id))
+        return keys
+
+
+class UserAsyncCRUD(AsyncCRUD[User, UserCreateSchema, UserUpdateSchema]):
+
+    def __init__(self, session: Union[Session, AsyncSession]):
+        super().__init__(UserCRUD, session=session)
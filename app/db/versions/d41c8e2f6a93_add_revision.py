@@ -0,0 +1,43 @@
+"""add revision
+
+Revision ID: d41c8e2f6a93
+Revises: b7e3f5a9c201
+Create Date: 2026-10-19 10:12:31.418205
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "d41c8e2f6a93"
+down_revision: Union[str, None] = "b7e3f5a9c201"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ["todo", "user"]
+
+
+def upgrade() -> None:
+    for table in TABLES:
+        op.add_column(
+            table,
+            sa.Column("revision", sa.BigInteger(), nullable=False, server_default="1"),
+        )
+        # 作成時と同様に、既存の行のrevisionも乱数(models.new_revision)から始める
+        op.execute(f"UPDATE `{table}` SET revision = FLOOR(1 + RAND() * 2147483647)")
+        # 作成時の値はアプリケーションで生成する
+        op.alter_column(
+            table,
+            "revision",
+            existing_type=sa.BigInteger(),
+            existing_nullable=False,
+            server_default=None,
+        )
+
+
+def downgrade() -> None:
+    for table in reversed(TABLES):
+        op.drop_column(table, "revision")
@@ -1,24 +1,173 @@
-import boto3
-from botocore.exceptions import BotoCoreError, ClientError
+import hashlib
+import json
+import time
+import urllib.request
+from functools import lru_cache
+from threading import Lock
+from typing import TYPE_CHECKING, Callable, Dict, Optional
+
 from fastapi import Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import APIKeyHeader
 
+from cache import SingleFlight, TTLCache
 from config import settings
+from instrumentation import measure
+
+# boto3(約0.1秒)とPyJWTは読み込みに時間がかかり、使用しない認証方式もあるため、
+# ワーカーの起動時ではなく最初に使用する時に読み込む
+if TYPE_CHECKING:
+    import jwt
 
 api_key_header = APIKeyHeader(name="Authorization", auto_error=True)
 
+# アクセストークンのハッシュをキーに、Cognitoから取得したユーザー情報を保持する
+token_cache = TTLCache(maxsize=settings.auth_cache_maxsize, ttl=settings.auth_cache_ttl)
 
-def verify_token(auth_header: str = Depends(api_key_header)):
-    if auth_header != "expected_token":
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Invalid authentication token",
+# NotAuthorizedExceptionとなったトークンを示すネガティブキャッシュの値
+_NOT_AUTHORIZED = object()
+
+# 同じトークンで同時に届いたリクエストの問い合わせを1回にまとめる
+token_lookups = SingleFlight()
+
+
+def fetch_json(url: str) -> dict:
+    with urllib.request.urlopen(url, timeout=5) as response:
+        return json.load(response)
+
+
+class JWKSCache:
+    """
+    ユーザープールのJWKSを保持し、kidに対応する公開鍵を返します。<br>
+    refresh_interval毎に再取得し、未知のkidが来た場合(鍵のローテーション)も再取得します。<br>
+    不正なkidによる再取得の連発を防ぐため、再取得の間隔はmin_refresh_interval以上空けます。
+    """
+
+    def __init__(
+        self,
+        url: str,
+        refresh_interval: float,
+        min_refresh_interval: float = 30,
+        fetch: Callable[[str], dict] = fetch_json,
+        timer: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.url = url
+        self.refresh_interval = refresh_interval
+        self.min_refresh_interval = min_refresh_interval
+        self.fetch = fetch
+        self.timer = timer
+        self.keys: Dict[str, "jwt.PyJWK"] = {}
+        self.fetched_at: Optional[float] = None
+        self._lock = Lock()
+
+    def refresh(self) -> None:
+        import jwt
+
+        jwks = self.fetch(self.url)
+        self.keys = {key["kid"]: jwt.PyJWK(key) for key in jwks["keys"]}
+        self.fetched_at = self.timer()
+
+    def _elapsed(self) -> float:
+        if self.fetched_at is None:
+            return float("inf")
+        return self.timer() - self.fetched_at
+
+    def get_key(self, kid: str) -> Optional["jwt.PyJWK"]:
+        with self._lock:
+            if self._elapsed() >= self.refresh_interval or (
+                kid not in self.keys and self._elapsed() >= self.min_refresh_interval
+            ):
+                try:
+                    self.refresh()
+                except Exception:
+                    # 取得に失敗した場合は、保持している鍵で検証を続ける
+                    if not self.keys:
+                        raise
+            return self.keys.get(kid)
+
+
+def get_issuer(user_pool_id: str) -> str:
+    region = user_pool_id.partition("_")[0]
+    return f"https://cognito-idp.{region}.amazonaws.com/{user_pool_id}"
+
+
+jwks_cache = JWKSCache(
+    url=f"{get_issuer(settings.customer_side_user_pool_id)}/.well-known/jwks.json",
+    refresh_interval=settings.jwks_refresh_interval,
+)
+
+
+def verify_access_token(
+    access_token: str, user_pool_id: str = settings.customer_side_user_pool_id
+) -> dict:
+    """
+    Cognitoのアクセストークンの署名・有効期限・発行者・client_idをローカルで検証し、
+    クレームを返します。
+    """
+    import jwt
+
+    unauthorized = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authorized"
+    )
+    try:
+        kid = jwt.get_unverified_header(access_token).get("kid")
+        key = jwks_cache.get_key(kid)
+        if key is None:
+            raise unauthorized
+        claims = jwt.decode(
+            access_token,
+            key.key,
+            algorithms=["RS256"],
+            issuer=get_issuer(user_pool_id),
+            options={"require": ["exp", "iss", "token_use", "client_id", "username"]},
         )
+    except jwt.PyJWTError:
+        raise unauthorized
+    if claims["token_use"] != "access":
+        raise unauthorized
+    if claims["client_id"] not in settings.cognito_app_client_ids:
+        raise unauthorized
+    return claims
+
+
+def token_cache_ttl(access_token: str, claims: Optional[dict] = None) -> float:
+    """
+    トークンのキャッシュの有効期間として、token_cache.ttlと有効期限(exp)までの秒数の短い方を返します。<br>
+    claimsを省略した場合は、Cognitoで検証済みのトークンからexpを署名の検証なしで読み取ります。
+    expを読み取れない場合はtoken_cache.ttlです。
+    """
+    import jwt
+
+    if claims is None:
+        try:
+            claims = jwt.decode(access_token, options={"verify_signature": False})
+        except jwt.PyJWTError:
+            claims = {}
+    exp = claims.get("exp")
+    if not isinstance(exp, (int, float)):
+        return token_cache.ttl
+    return min(token_cache.ttl, exp - time.time())
+
+
+def verify_token(auth_header: str = Depends(api_key_header)):
+    with measure("auth"):
+        if auth_header != "expected_token":
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Invalid authentication token",
+            )
 
 
 def get_user_from_token(
-    auth_header: str, user_pool_id: str = settings.customer_side_user_pool_id
+    auth_header: str,
+    user_pool_id: str = settings.customer_side_user_pool_id,
+    with_attributes: bool = True,
 ):
+    """
+    Authorizationヘッダーのアクセストークンからユーザー情報を取得します。<br>
+    settings.auth_modeが"jwt"の場合はトークンをローカルで検証し、
+    with_attributesがTrueの場合のみadmin_get_userで属性を取得します。
+    """
     if not auth_header:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -30,41 +179,136 @@ def get_user_from_token(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authorization scheme",
         )
+
+    claims = None
+    if settings.auth_mode == "jwt":
+        claims = verify_access_token(access_token, user_pool_id)
+        if not with_attributes:
+            return {"user_id": claims["username"]}
+
+    cache_key = hashlib.sha256(access_token.encode()).hexdigest()
+    cached = token_cache.get(cache_key)
+    if cached is _NOT_AUTHORIZED:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authorized"
+        )
+    if cached is not None:
+        return dict(cached)
+
     try:
-        client = boto3.client("cognito-idp")
+        if claims is not None:
+            result = fetch_user_attributes(claims["username"], user_pool_id)
+        else:
+            result = fetch_user_from_cognito(access_token, user_pool_id)
+    except HTTPException as e:
+        if e.status_code == status.HTTP_401_UNAUTHORIZED:
+            token_cache.set(
+                cache_key, _NOT_AUTHORIZED, ttl=settings.auth_cache_negative_ttl
+            )
+        raise
+
+    # 有効期限を過ぎたトークンをキャッシュから受け付けないよう、expまでしか保持しない
+    ttl = token_cache_ttl(access_token, claims)
+    if ttl > 0:
+        token_cache.set(cache_key, result, ttl=ttl)
+    return dict(result)
+
+
+@lru_cache(maxsize=None)
+def get_cognito_client():
+    """
+    プロセス内で共有するCognitoクライアントを返します。
+    boto3のクライアントはスレッドセーフなため、スレッドプールから共有して利用できます。
+    """
+    import boto3
 
+    return boto3.client("cognito-idp")
+
+
+def raise_cognito_error(e: Exception):
+    error_code = getattr(e, "response", {}).get("Error", {}).get("Code")
+    if error_code == "NotAuthorizedException":
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authorized"
+        )
+    elif error_code == "UserNotFoundException":
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+        )
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Internal server error",
+        )
+
+
+def fetch_user_from_cognito(access_token: str, user_pool_id: str) -> dict:
+    """
+    Cognitoに問い合わせてアクセストークンのユーザー情報を取得します。
+    """
+    from botocore.exceptions import BotoCoreError, ClientError
+
+    client = get_cognito_client()
+    try:
         user_response = client.get_user(AccessToken=access_token)
-        user_id = user_response["Username"]
+    except (BotoCoreError, ClientError) as e:
+        raise_cognito_error(e)
+    return fetch_user_attributes(user_response["Username"], user_pool_id, client)
+
+
+def fetch_user_attributes(user_id: str, user_pool_id: str, client=None) -> dict:
+    """
+    admin_get_userでユーザーの属性(カスタム属性を含む)を取得します。
+    """
+    from botocore.exceptions import BotoCoreError, ClientError
 
+    if client is None:
+        client = get_cognito_client()
+    try:
         admin_response = client.admin_get_user(
             UserPoolId=user_pool_id,
             Username=user_id,
         )
+    except (BotoCoreError, ClientError) as e:
+        raise_cognito_error(e)
 
-        user_attributes = {
-            item["Name"].replace("custom:", ""): item["Value"]
-            for item in admin_response["UserAttributes"]
-        }
+    user_attributes = {
+        item["Name"].replace("custom:", ""): item["Value"]
+        for item in admin_response["UserAttributes"]
+    }
 
-        result = {"user_id": user_id, **user_attributes}
-        return result
+    result = {"user_id": user_id, **user_attributes}
+    return result
 
-    except (BotoCoreError, ClientError) as e:
 
-        if e.response["Error"]["Code"] == "NotAuthorizedException":
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authorized"
-            )
-        elif e.response["Error"]["Code"] == "UserNotFoundException":
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
-            )
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Internal server error",
-            )
+async def get_user_from_token_async(
+    auth_header: str,
+    user_pool_id: str = settings.customer_side_user_pool_id,
+    with_attributes: bool = True,
+):
+    """
+    get_user_from_tokenをスレッドプールで実行し、イベントループをブロックしません。
+    同じトークンの問い合わせが実行中の場合は、その結果を待って共有します。
+    """
+    key = (
+        hashlib.sha256(auth_header.encode()).hexdigest(),
+        user_pool_id,
+        with_attributes,
+    )
+    with measure("auth"):
+        result = await token_lookups.do(
+            key,
+            lambda: run_in_threadpool(
+                get_user_from_token, auth_header, user_pool_id, with_attributes
+            ),
+        )
+    return dict(result)
+
+
+async def get_user_info(request: Request, auth_header: str = Depends(api_key_header)):
+    return await get_user_from_token_async(auth_header)
 
 
-def get_user_info(request: Request, auth_header: str = Depends(api_key_header)):
-    return get_user_from_token(auth_header)
+async def get_user_id(request: Request, auth_header: str = Depends(api_key_header)):
+    user = await get_user_from_token_async(auth_header, with_attributes=False)
+    return user["user_id"]
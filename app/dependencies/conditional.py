@@ -0,0 +1,53 @@
+import hashlib
+import json
+from typing import Any, Optional
+
+from fastapi import Header, Response, status
+
+# 条件付きGETで使用するレスポンスヘッダー
+ETAG_HEADER = "ETag"
+
+
+def make_etag(*parts: Any) -> str:
+    """
+    partsから強いETagを作成します。<br>
+    単体はidとupdated_at、一覧は件数とupdated_atの最大値など、
+    内容が変わると必ず変わる値を指定します。
+    """
+    value = json.dumps(
+        [
+            part.isoformat() if hasattr(part, "isoformat") else str(part)
+            for part in parts
+        ]
+    )
+    return f'"{hashlib.sha256(value.encode()).hexdigest()[:32]}"'
+
+
+class ConditionalRequest:
+    """
+    If-None-Matchヘッダーを受け取り、ETagによる条件付きGETを処理する依存関係です。<br>
+    ETagが一致する場合は、シリアライズを行わずに304を返します。
+    """
+
+    def __init__(
+        self,
+        if_none_match: Optional[str] = Header(
+            default=None, description="前回のレスポンスのETag"
+        ),
+    ) -> None:
+        self.if_none_match = if_none_match
+
+    def matches(self, etag: str) -> bool:
+        if self.if_none_match is None:
+            return False
+        if self.if_none_match.strip() == "*":
+            return True
+        # If-None-Matchは弱い比較のため、W/の有無は区別しない
+        return etag in (
+            value.strip().removeprefix("W/") for value in self.if_none_match.split(",")
+        )
+
+    def not_modified(self, etag: str) -> Response:
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers={ETAG_HEADER: etag}
+        )
@@ -1,14 +1,283 @@
+import asyncio
+import itertools
+import time
+from threading import Lock
+from typing import List, Optional
+
+from fastapi import Request, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import event, exc, make_url
+from sqlalchemy.engine import Engine, ExceptionContext
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
 from sqlmodel import Session, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from config import settings
+from cruds import REPLICA_SESSION_INFO
 
 DATABASE_URL = settings.database_url
 
-engine = create_engine(DATABASE_URL)
 
-session = Session(engine)
+class PoolMetrics:
+    """
+    コネクションプールからの取得回数・待ち時間・タイムアウト回数を集計します。
+    """
+
+    def __init__(self) -> None:
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self._lock = Lock()
+
+    def observe(self, wait_seconds: float, timed_out: bool) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.timeouts += timed_out
+            self.wait_seconds_total += wait_seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, wait_seconds)
+
+
+class InstrumentedPoolMixin:
+    """
+    QueuePoolからの接続の取得にかかった時間と、pool_timeoutによるタイムアウトを記録します。
+    """
+
+    metrics: PoolMetrics
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            self.metrics.observe(time.perf_counter() - start, timed_out)
+
+
+class InstrumentedQueuePool(InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncAdaptedQueuePool(InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+pool_options = dict(
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout,
+    pool_recycle=settings.db_pool_recycle,
+    pool_pre_ping=settings.db_pool_pre_ping,
+)
+
+engine = create_engine(DATABASE_URL, poolclass=InstrumentedQueuePool, **pool_options)
+
+# DB_ASYNC=true の場合のみ非同期ドライバ(aiomysql)のエンジンを作成する
+async_engine = (
+    create_async_engine(
+        settings.async_database_url,
+        poolclass=InstrumentedAsyncAdaptedQueuePool,
+        **pool_options,
+    )
+    if settings.db_async
+    else None
+)
+
+# 参照をプライマリで行う(直前の更新を読む)ことを指定するリクエストヘッダー
+READ_YOUR_WRITES_HEADER = "X-Read-Your-Writes"
+# 更新後read_your_writes_seconds秒の間、参照をプライマリで行うためのCookie
+READ_PRIMARY_COOKIE = "read_primary"
+
+# レプリカで処理できる、更新を行わないメソッド
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+
+class Replica:
+    """
+    参照用のレプリカです。ヘルスチェックに失敗した場合や接続が切断された場合は、
+    次のヘルスチェックに成功するまで使用しません。
+    """
+
+    def __init__(self, url: str) -> None:
+        self.url = make_url(url)
+        self.engine = create_engine(
+            self.url, poolclass=InstrumentedQueuePool, **pool_options
+        )
+        self.async_engine: Optional[AsyncEngine] = None
+        # SQLのイベントを登録する同期エンジン。非同期エンジンの場合はsync_engine
+        self.sync_engines: List[Engine] = [self.engine]
+        if settings.db_async:
+            self.async_engine = create_async_engine(
+                self.url.set(drivername="mysql+aiomysql"),
+                poolclass=InstrumentedAsyncAdaptedQueuePool,
+                **pool_options,
+            )
+            self.sync_engines.append(self.async_engine.sync_engine)
+        self.healthy = True
+        for replica_engine in self.sync_engines:
+            event.listen(replica_engine, "handle_error", self._handle_error)
+
+    def _handle_error(self, context: ExceptionContext) -> None:
+        if context.is_disconnect:
+            self.healthy = False
 
+    def check(self) -> bool:
+        try:
+            with self.engine.connect() as conn:
+                conn.exec_driver_sql("SELECT 1")
+            self.healthy = True
+        except exc.DBAPIError:
+            self.healthy = False
+        return self.healthy
 
-def get_session():
-    with Session(engine) as session:
+
+class ReplicaSet:
+    """
+    レプリカをラウンドロビンで選択します。正常なレプリカが無い場合はNoneを返します。
+    """
+
+    def __init__(self, urls: List[str], health_check_interval: float) -> None:
+        self.replicas = [Replica(url) for url in urls]
+        self.health_check_interval = health_check_interval
+        self._cycle = itertools.cycle(self.replicas)
+        self._lock = Lock()
+
+    def choose(self) -> Optional[Replica]:
+        with self._lock:
+            for _ in range(len(self.replicas)):
+                replica = next(self._cycle)
+                if replica.healthy:
+                    return replica
+        return None
+
+    def check(self) -> None:
+        for replica in self.replicas:
+            replica.check()
+
+    async def run_health_checks(self) -> None:
+        """
+        health_check_interval毎に全てのレプリカのヘルスチェックを行います。
+        """
+        while True:
+            await run_in_threadpool(self.check)
+            await asyncio.sleep(self.health_check_interval)
+
+
+replica_set = ReplicaSet(
+    settings.db_replica_urls, settings.db_replica_health_check_interval
+)
+
+
+def sync_engines() -> List[Engine]:
+    """
+    プライマリと全てのレプリカの同期エンジン(非同期エンジンの場合はsync_engine)を返します。<br>
+    SQLの計測・記録のイベントは、レプリカで処理した参照も対象になるようこの全てに登録します。
+    """
+    engines = [engine]
+    if async_engine is not None:
+        engines.append(async_engine.sync_engine)
+    for replica in replica_set.replicas:
+        engines.extend(replica.sync_engines)
+    return engines
+
+
+def should_use_replica(request: Request) -> bool:
+    """
+    更新を行わないメソッドで、直前の更新を読む指定(ヘッダー・更新後のCookie)が
+    無いリクエストの場合にレプリカを使用します。
+    """
+    return (
+        request.method in SAFE_METHODS
+        and READ_YOUR_WRITES_HEADER not in request.headers
+        and READ_PRIMARY_COOKIE not in request.cookies
+    )
+
+
+def get_pool_status(pool: Pool) -> dict:
+    """
+    プールの接続数と、取得の待ち時間・タイムアウトの集計を返します。
+    """
+    status = {}
+    if isinstance(pool, QueuePool):
+        status.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            # pool_sizeを超えて作成されている接続の数
+            overflow=max(pool.overflow(), 0),
+            max_overflow=pool._max_overflow,
+            timeout=pool.timeout(),
+        )
+    metrics = getattr(pool, "metrics", None)
+    if metrics is not None:
+        status.update(
+            checkouts=metrics.checkouts,
+            timeouts=metrics.timeouts,
+            wait_seconds_total=metrics.wait_seconds_total,
+            wait_seconds_avg=(
+                metrics.wait_seconds_total / metrics.checkouts
+                if metrics.checkouts
+                else 0.0
+            ),
+            wait_seconds_max=metrics.wait_seconds_max,
+        )
+    return status
+
+
+def choose_replica(request: Request, response: Response) -> Optional[Replica]:
+    """
+    参照のみのリクエストはレプリカを返し、更新を行うリクエストはNone(プライマリ)を返します。<br>
+    レプリカがある場合は、更新後read_your_writes_seconds秒の間は同じクライアントの参照も
+    プライマリで行います。
+    """
+    replica = replica_set.choose() if should_use_replica(request) else None
+    if (
+        replica_set.replicas
+        and replica is None
+        and request.method not in SAFE_METHODS
+        and settings.read_your_writes_seconds
+    ):
+        response.set_cookie(
+            READ_PRIMARY_COOKIE,
+            "1",
+            max_age=settings.read_your_writes_seconds,
+            httponly=True,
+            samesite="lax",
+        )
+    return replica
+
+
+def get_sync_session(request: Request, response: Response):
+    """
+    リクエスト毎のSessionを返します。<br>
+    同期の依存関係はスレッドプールで実行されるため、
+    セッションの終了(ロールバック・接続の返却)もイベントループをブロックしません。
+    """
+    replica = choose_replica(request, response)
+    bind = replica.engine if replica is not None else engine
+    info = {REPLICA_SESSION_INFO: replica is not None}
+    with Session(bind, expire_on_commit=False, info=info) as session:
         yield session
+
+
+async def get_async_session(request: Request, response: Response):
+    """
+    リクエスト毎のAsyncSessionを返します。settings.db_asyncが有効な場合に使用します。
+    """
+    replica = choose_replica(request, response)
+    bind = replica.async_engine if replica is not None else async_engine
+    info = {REPLICA_SESSION_INFO: replica is not None}
+    async with AsyncSession(bind, expire_on_commit=False, info=info) as session:
+        yield session
+
+
+# リクエスト毎のセッション。どちらのセッションもcruds.AsyncCRUDから利用できる
+get_session = get_async_session if settings.db_async else get_sync_session
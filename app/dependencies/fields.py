@@ -0,0 +1,195 @@
+import hashlib
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, List, Mapping, Optional, Tuple, Type
+
+from fastapi import HTTPException, Query, Response, status
+from pydantic import ConfigDict, TypeAdapter, create_model
+from sqlalchemy.orm import lazyload, load_only
+from sqlmodel import SQLModel
+
+from config import settings
+from cruds import CRUD
+from cruds.todo_crud import TodoCRUD
+from cruds.user_crud import UserCRUD
+from dependencies.conditional import make_etag
+from models.todo import Todo, TodoReadSchema, UserReadWithTodosSchema
+from models.user import User
+
+# fieldsの指定に関わらず読み込む、ページングのカーソル(created_at, id)と
+# 変更の判定(updated_at, ETagのrevision)に使用する列
+ALWAYS_LOADED_COLUMNS = frozenset({"id", "created_at", "updated_at", "revision"})
+
+
+@lru_cache(maxsize=None)
+def get_partial_adapter(
+    schema: Type[SQLModel], names: FrozenSet[str], many: bool
+) -> TypeAdapter:
+    """
+    schemaのうちnamesの項目だけを持つスキーマのTypeAdapterを返します。
+    """
+    partial = create_model(
+        f"{schema.__name__}Fields",
+        __config__=ConfigDict(from_attributes=True),
+        **{
+            name: (field.annotation, field)
+            for name, field in schema.model_fields.items()
+            if name in names
+        },
+    )
+    return TypeAdapter(List[partial] if many else partial)
+
+
+class Projection:
+    """
+    SparseFieldsetで指定された項目とリレーションです。<br>
+    options()をクエリに渡して必要な列とリレーションだけを読み込み、
+    render()で指定された項目だけのレスポンスを返します。
+    """
+
+    def __init__(
+        self,
+        fieldset: "SparseFieldset",
+        fields: Optional[FrozenSet[str]],
+        include: FrozenSet[str],
+    ) -> None:
+        self.fieldset = fieldset
+        self.fields = fields
+        self.include = include
+
+    @property
+    def is_default(self) -> bool:
+        return self.fields is None and self.include == self.fieldset.default_include
+
+    def options(self) -> List[Any]:
+        model = self.fieldset.model
+        # 指定されていないリレーションは読み込まない
+        options = [lazyload("*")]
+        if self.fields is not None:
+            # ページングのカーソル・ETagの作成に使用する列は、指定が無くても読み込む
+            names = self.fields | ALWAYS_LOADED_COLUMNS
+            options.append(load_only(*[getattr(model, name) for name in names]))
+        for name in self.include:
+            options.append(self.fieldset.relationships[name])
+        return options
+
+    def etag(self, *parts: Any) -> str:
+        """
+        partsと指定された項目・リレーションから、表現毎に異なるETagを作成します。
+        """
+        fields = None if self.fields is None else sorted(self.fields)
+        return make_etag(*parts, fields, sorted(self.include))
+
+    def etag_of(self, key: Any, obj: Any) -> Tuple[str, Optional[bytes]]:
+        """
+        objのETagと、ETagの作成のためにシリアライズした内容(無い場合はNone)を返します。<br>
+        DBから読み込んだモデルは、CRUD.fingerprintと同じ値(件数とrevisionの合計)から作成します。<br>
+        エンティティキャッシュのread_schemaにはrevisionが無いため、シリアライズした内容から作成します。
+        """
+        objs = obj if isinstance(obj, list) else [obj]
+        if all(isinstance(item, self.fieldset.model) for item in objs):
+            fingerprint = CRUD.fingerprint_of(objs, sorted(self.include))
+            return self.etag(key, *fingerprint), None
+        content = self.serialize(obj)
+        return self.etag(key, hashlib.sha256(content).hexdigest()), content
+
+    def serialize(self, obj: Any) -> bytes:
+        """
+        objを、指定された項目・リレーションだけのJSONにします。
+        """
+        many = isinstance(obj, list)
+        if self.is_default:
+            adapter = self.fieldset.adapters[many]
+        else:
+            fields = self.fields or frozenset(self.fieldset.columns)
+            adapter = get_partial_adapter(
+                self.fieldset.schema, fields | self.include, many
+            )
+        return adapter.dump_json(adapter.validate_python(obj, from_attributes=True))
+
+    def render(
+        self,
+        obj: Any,
+        headers: Optional[Mapping[str, str]] = None,
+        content: Optional[bytes] = None,
+    ) -> Any:
+        """
+        指定が無い場合はobjをそのまま返し、response_modelでシリアライズさせます。
+        指定がある場合は、指定された項目だけをJSONにしたResponseを返します。<br>
+        settings.fast_json_responseが有効な場合は、指定が無くても事前に作成した
+        TypeAdapterで直接JSONにし、response_modelによる再検証を行いません。<br>
+        contentを指定した場合は、シリアライズ済みの内容としてそのまま返します。
+        """
+        if content is None:
+            if self.is_default and not settings.fast_json_response:
+                return obj
+            content = self.serialize(obj)
+        return Response(
+            content=content, media_type="application/json", headers=dict(headers or {})
+        )
+
+
+class SparseFieldset:
+    """
+    fields・includeクエリパラメータで、レスポンスに含める項目と
+    読み込むリレーションを指定できるようにする依存関係です。<br>
+    relationshipsには、リレーション名とその読み込みに使うローダーオプションを指定します。<br>
+    fields: 取得する列(カンマ区切り)。idは常に含まれます。<br>
+    include: 取得するリレーション(カンマ区切り)。
+    指定しない場合は全てのリレーションを、空文字の場合はリレーションを読み込みません。
+    """
+
+    def __init__(
+        self,
+        model: Type[SQLModel],
+        schema: Type[SQLModel],
+        relationships: Dict[str, Any],
+    ) -> None:
+        self.model = model
+        self.schema = schema
+        self.relationships = relationships
+        self.default_include = frozenset(relationships)
+        self.columns = [
+            name for name in schema.model_fields if name not in relationships
+        ]
+        # 一覧(True)と単体(False)のレスポンスをシリアライズするTypeAdapter
+        self.adapters = {True: TypeAdapter(List[schema]), False: TypeAdapter(schema)}
+
+    def _parse(self, value: str, allowed: List[str], name: str) -> FrozenSet[str]:
+        names = frozenset(item.strip() for item in value.split(",") if item.strip())
+        unknown = names - set(allowed)
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown {name}: {', '.join(sorted(unknown))}",
+            )
+        return names
+
+    def __call__(
+        self,
+        fields: Optional[str] = Query(
+            default=None, description="取得する項目(カンマ区切り)"
+        ),
+        include: Optional[str] = Query(
+            default=None, description="取得するリレーション(カンマ区切り)"
+        ),
+    ) -> Projection:
+        return Projection(
+            self,
+            (
+                None
+                if fields is None
+                else self._parse(fields, self.columns, "fields") | {"id"}
+            ),
+            (
+                self.default_include
+                if include is None
+                else self._parse(include, list(self.relationships), "include")
+            ),
+        )
+
+
+todo_fields = SparseFieldset(Todo, TodoReadSchema, TodoCRUD.relationship_loaders)
+
+user_fields = SparseFieldset(
+    User, UserReadWithTodosSchema, UserCRUD.relationship_loaders
+)
@@ -0,0 +1,201 @@
+import asyncio
+import functools
+import json
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, Mapping, Optional
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from config import settings
+from dependencies.database import sync_engines
+
+SERVER_TIMING_HEADER = "Server-Timing"
+
+slow_query_logger = logging.getLogger("slow_query")
+
+
+class RequestTimings:
+    """
+    1リクエストで発行したSQLの件数・時間と、認証・シリアライズなどにかかった時間です。
+    """
+
+    def __init__(self, scope: Scope) -> None:
+        self.scope = scope
+        self.db_count = 0
+        self.db_seconds = 0.0
+        self.durations: Dict[str, float] = {}
+        # エンドポイントの関数が終了した時刻。ここからレスポンスの開始までをシリアライズとする
+        self.endpoint_finished_at: Optional[float] = None
+
+    @property
+    def route(self) -> str:
+        route = self.scope.get("route")
+        path = route.path if route is not None else self.scope["path"]
+        return f"{self.scope['method']} {self.scope.get('root_path', '')}{path}"
+
+    def add(self, name: str, seconds: float) -> None:
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+    def server_timing(self, total_seconds: float) -> str:
+        metrics = [
+            f'db;dur={self.db_seconds * 1000:.1f};desc="{self.db_count} queries"'
+        ]
+        metrics += [
+            f"{name};dur={seconds * 1000:.1f}"
+            for name, seconds in self.durations.items()
+        ]
+        metrics.append(f"total;dur={total_seconds * 1000:.1f}")
+        return ", ".join(metrics)
+
+
+_timings: ContextVar[Optional[RequestTimings]] = ContextVar(
+    "request_timings", default=None
+)
+
+
+@contextmanager
+def measure(name: str) -> Iterator[None]:
+    """
+    with文の中の処理時間を、実行中のリクエストのServer-Timingにnameとして加算します。
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = _timings.get()
+        if timings is not None:
+            timings.add(name, time.perf_counter() - start)
+
+
+def parameter_shape(parameters: Any) -> Any:
+    """
+    SQLのパラメーターを、値を含まない型の一覧に変換します。
+    """
+    if isinstance(parameters, Mapping):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_start_time = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._query_start_time
+    timings = _timings.get()
+    if timings is not None:
+        timings.db_count += 1
+        timings.db_seconds += elapsed
+    if elapsed >= settings.slow_query_seconds:
+        if executemany:
+            shape = {"rows": len(parameters), "row": parameter_shape(parameters[0])}
+        else:
+            shape = parameter_shape(parameters)
+        slow_query_logger.warning(
+            json.dumps(
+                {
+                    "event": "slow_query",
+                    "route": timings.route if timings is not None else None,
+                    "duration_ms": round(elapsed * 1000, 1),
+                    "statement": statement,
+                    "parameter_shape": shape,
+                },
+                ensure_ascii=False,
+            )
+        )
+
+
+def install(engine: Engine) -> None:
+    """
+    engineで発行されるSQLの件数と時間を計測し、遅いSQLをログに出力するようにします。
+    """
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def uninstall(engine: Engine) -> None:
+    event.remove(engine, "before_cursor_execute", _before_cursor_execute)
+    event.remove(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _mark_endpoint_finished() -> None:
+    timings = _timings.get()
+    if timings is not None:
+        timings.endpoint_finished_at = time.perf_counter()
+
+
+def _instrument_endpoint(endpoint: Callable[..., Any]) -> Callable[..., Any]:
+    if asyncio.iscoroutinefunction(endpoint):
+
+        @functools.wraps(endpoint)
+        async def instrumented(*args, **kwargs):
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                _mark_endpoint_finished()
+
+    else:
+
+        @functools.wraps(endpoint)
+        def instrumented(*args, **kwargs):
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                _mark_endpoint_finished()
+
+    return instrumented
+
+
+class InstrumentedRoute(APIRoute):
+    """
+    エンドポイントの関数の終了時刻を記録し、
+    レスポンスの作成(response_modelでの検証・シリアライズ)にかかった時間を計測するルートです。
+    """
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any) -> None:
+        super().__init__(path, _instrument_endpoint(endpoint), **kwargs)
+
+
+class ServerTimingMiddleware:
+    """
+    リクエスト毎のSQLの件数・時間、認証・シリアライズ・全体の時間を
+    Server-Timingヘッダーで返すミドルウェアです。
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        timings = RequestTimings(scope)
+        token = _timings.set(timings)
+
+        async def send_with_server_timing(message: Message) -> None:
+            if message["type"] == "http.response.start" and settings.server_timing:
+                now = time.perf_counter()
+                if timings.endpoint_finished_at is not None:
+                    timings.add("serialize", now - timings.endpoint_finished_at)
+                headers = MutableHeaders(scope=message)
+                headers.append(SERVER_TIMING_HEADER, timings.server_timing(now - start))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_server_timing)
+        finally:
+            _timings.reset(token)
+
+
+for target in sync_engines():
+    install(target)
@@ -0,0 +1,22 @@
+"""
+ステータス・担当者毎のTodoの件数のテーブルを、todoテーブルから集計し直すジョブです。<br>
+CRUDを経由しない変更(直接のSQLやユーザーの削除など)による差異を修正するため、
+cronなどで定期的に実行します。
+
+実行方法: python -m jobs.reconcile_todo_counts
+"""
+
+from sqlmodel import Session
+
+from cruds.todo_crud import TodoCRUD
+from dependencies.database import engine
+
+
+def main() -> None:
+    with Session(engine) as session:
+        corrected = TodoCRUD(session).reconcile_status_counts()
+    print(f"件数が異なっていた組み合わせ: {corrected}")
+
+
+if __name__ == "__main__":
+    main()
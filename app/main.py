@@ -1,11 +1,38 @@
+import asyncio
+from contextlib import asynccontextmanager, suppress
+
 from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from config import settings
+from cruds import NEXT_CURSOR_HEADER
 from dependencies.authorization import verify_token
-from routers import models, todos, users
+from dependencies.conditional import ETAG_HEADER
+from dependencies.database import replica_set
+from instrumentation import ServerTimingMiddleware
+from metrics import METRICS_PATH, MetricsMiddleware, mark_process_dead, metrics_endpoint
+from query_plans import QueryPlanMiddleware, query_plan_advisor
+from routers import board, models, todos, users
+from routers.admin import cache as admin_cache
+from routers.admin import database as admin_database
+from routers.admin import query_plans as admin_query_plans
+from routers.admin import todo_counts as admin_todo_counts
 from routers.admin import users as admin_users
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    health_checks = None
+    if replica_set.replicas:
+        health_checks = asyncio.create_task(replica_set.run_health_checks())
+    yield
+    if health_checks is not None:
+        health_checks.cancel()
+        with suppress(asyncio.CancelledError):
+            await health_checks
+    mark_process_dead()
+
+
 app = FastAPI(
     title="カンバンタスク管理アプリケーション",
     description="カンバンタスク管理アプリケーションは、タスクの管理とユーザーの管理を行うアプリケーションです。",
@@ -34,12 +61,17 @@ app = FastAPI(
             "name": "todos",
             "description": "**タスク管理**に関する操作。",
         },
+        {
+            "name": "board",
+            "description": "**カンバンボード**の集計に関する操作。",
+        },
         {
             "name": "models",
             "description": "テスト用のエンドポイント。",
         },
     ],
     dependencies=[Depends(verify_token)],
+    lifespan=lifespan,
 )
 
 
@@ -49,7 +81,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, ETAG_HEADER],
 )
+# QUERY_PLAN_ADVISOR=true の場合のみ、エンドポイント毎に発行されたSQLを記録する
+app.add_middleware(QueryPlanMiddleware, advisor=query_plan_advisor)
+app.add_middleware(ServerTimingMiddleware)
+# 管理者用APIを含む、/metrics以外の全てのリクエストを記録する
+app.add_middleware(MetricsMiddleware)
 
 
 @app.get("/")
@@ -57,7 +95,7 @@ async def root():
     return {"message": "Hello World"}
 
 
-for router in [todos.router, users.router, models.router]:
+for router in [todos.router, users.router, board.router, models.router]:
     app.include_router(
         router,
         prefix="/api/v1",
@@ -83,6 +121,22 @@ admin_api = FastAPI(
             "name": "users",
             "description": "**ユーザー管理**に関する操作。",
         },
+        {
+            "name": "cache",
+            "description": "**キャッシュ**の状態に関する操作。",
+        },
+        {
+            "name": "database",
+            "description": "**データベース接続**の状態に関する操作。",
+        },
+        {
+            "name": "query-plans",
+            "description": "**SQLの実行計画**に関する操作。",
+        },
+        {
+            "name": "todo-counts",
+            "description": "**Todoの件数の集計**に関する操作。",
+        },
     ],
     # servers=[
     #     {"url": "/docs", "description": "顧客用"},
@@ -94,5 +148,12 @@ admin_api.include_router(
     admin_users.router,
     # prefix="/api/v1",
 )
+admin_api.include_router(admin_cache.router)
+admin_api.include_router(admin_database.router)
+admin_api.include_router(admin_query_plans.router)
+admin_api.include_router(admin_todo_counts.router)
 
 app.mount("/admin", admin_api)
+
+# Prometheusのスクレイプ用。APIRouteではないため、verify_tokenは適用されない
+app.add_route(METRICS_PATH, metrics_endpoint, include_in_schema=False)
@@ -0,0 +1,116 @@
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# uvicornを複数のワーカープロセスで起動する場合は、環境変数PROMETHEUS_MULTIPROC_DIRに
+# 全プロセスで共有するディレクトリを指定する。各プロセスの値はこのディレクトリに書き込まれ、
+# /metricsではその合計を返す
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+METRICS_PATH = "/metrics"
+
+# ルートに一致しなかったリクエストのラベル。生のパスを使うとラベルの種類が増え続けるため使わない
+UNMATCHED_ROUTE = "<unmatched>"
+
+REQUESTS = Counter(
+    "http_requests_total",
+    "リクエスト数",
+    ["method", "route", "status"],
+)
+ERRORS = Counter(
+    "http_request_errors_total",
+    "ステータスコードが5xx、または例外となったリクエスト数",
+    ["method", "route", "status"],
+)
+LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "リクエストの処理時間(秒)",
+    ["method", "route", "status"],
+)
+IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "処理中のリクエスト数",
+    ["method"],
+    multiprocess_mode="livesum",
+)
+
+
+def get_registry() -> CollectorRegistry:
+    """
+    /metricsで返すレジストリです。マルチプロセスの場合は全プロセスの値を集計します。
+    """
+    if MULTIPROC_DIR is None:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def mark_process_dead() -> None:
+    """
+    終了するワーカープロセスの処理中のリクエスト数を、集計から除外します。
+    """
+    if MULTIPROC_DIR is not None:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    return Response(generate_latest(get_registry()), media_type=CONTENT_TYPE_LATEST)
+
+
+class MetricsMiddleware:
+    """
+    リクエスト数・エラー数・処理時間を、ルートのパス(/todos/{id}など)と
+    ステータスコード毎に記録するミドルウェアです。
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] == METRICS_PATH:
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        status_code = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        in_progress = IN_PROGRESS.labels(method)
+        in_progress.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        except Exception:
+            status_code = 500
+            raise
+        finally:
+            in_progress.dec()
+            route = scope.get("route")
+            template = (
+                f"{scope.get('root_path', '')}{route.path}"
+                if route is not None
+                else UNMATCHED_ROUTE
+            )
+            labels = (method, template, str(status_code))
+            REQUESTS.labels(*labels).inc()
+            LATENCY.labels(*labels).observe(time.perf_counter() - start)
+            if status_code >= 500:
+                ERRORS.labels(*labels).inc()
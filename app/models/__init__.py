@@ -1,12 +1,29 @@
+import random
 from datetime import datetime
+from typing import Any, Dict, List, Optional
 from uuid import UUID, uuid4
+from zoneinfo import ZoneInfo
 
-import pytz
+from sqlalchemy import BigInteger, text
 from sqlmodel import Field, SQLModel
 
+JST = ZoneInfo("Asia/Tokyo")
 
-def get_current_time_japan():
-    return datetime.now(pytz.timezone("Asia/Tokyo"))
+
+def get_current_time_japan() -> datetime:
+    """
+    日本時間の現在時刻を、DBに保存される値(タイムゾーン無し・秒単位)で返します。<br>
+    作成・更新する行毎に呼び出され、コミット後に値を読み込み直す必要はありません。
+    """
+    return datetime.now(JST).replace(tzinfo=None, microsecond=0)
+
+
+def new_revision() -> int:
+    """
+    作成する行のrevisionの初期値を返します。<br>
+    削除した行と作成した行でrevisionの合計(一覧のETag)が同じにならないよう、乱数から始めます。
+    """
+    return random.randrange(1, 2**31)
 
 
 class BaseCreateSchema(SQLModel):
@@ -17,6 +34,33 @@ class BaseUpdateSchema(SQLModel):
     pass
 
 
+class BulkItemResult(SQLModel):
+    """
+    一括作成の各要素の結果です。<br>
+    成功した場合はidを、失敗した場合はerrorsを返します。<br>
+    <br>
+    Attributes:<br>
+        index (int): リクエストの配列における位置。<br>
+        id (Optional[UUID]): 作成したオブジェクトのID。<br>
+        errors (Optional[List[Dict[str, Any]]]): 作成できなかった理由。<br>
+    """
+
+    index: int
+    id: Optional[UUID] = None
+    errors: Optional[List[Dict[str, Any]]] = None
+
+
+class BulkOperationResult(SQLModel):
+    """
+    一括更新・一括削除の結果です。<br>
+    <br>
+    Attributes:<br>
+        count (int): 更新・削除した件数。<br>
+    """
+
+    count: int
+
+
 class BaseTable(SQLModel, table=False):
     id: UUID = Field(
         default_factory=uuid4,
@@ -25,7 +69,9 @@ class BaseTable(SQLModel, table=False):
         nullable=False,
     )
     created_at: datetime | None = Field(
-        default=get_current_time_japan(), nullable=False, description="作成日時"
+        default_factory=get_current_time_japan,
+        nullable=False,
+        description="作成日時",
     )
     updated_at: datetime | None = Field(
         default_factory=get_current_time_japan,
@@ -33,3 +79,10 @@ class BaseTable(SQLModel, table=False):
         description="更新日時",
         sa_column_kwargs={"onupdate": get_current_time_japan},
     )
+    revision: int = Field(
+        default_factory=new_revision,
+        sa_type=BigInteger,
+        nullable=False,
+        description="版 書き込み毎に1増える。ETagの作成に使用する",
+        sa_column_kwargs={"default": new_revision, "onupdate": text("revision + 1")},
+    )
@@ -0,0 +1,61 @@
+from typing import List, Optional
+from uuid import UUID
+
+from sqlmodel import Field, SQLModel
+
+from models.todo import TaskStatus, TodoReadSchema
+
+
+class BoardAssigneeCountSchema(SQLModel):
+    """
+    ボードの列における、担当者毎のTodoの件数です。<br>
+    <br>
+    Attributes:<br>
+        assignee_id (Optional[UUID]): 担当者のID。未割り当ての場合はNoneです。<br>
+        count (int): 件数。<br>
+    """
+
+    assignee_id: Optional[UUID] = Field(default=None, description="担当者")
+    count: int = Field(description="件数")
+
+
+class BoardColumnCountSchema(SQLModel):
+    """
+    ボードの1列(ステータス)の件数です。<br>
+    <br>
+    Attributes:<br>
+        status (TaskStatus): ステータス。<br>
+        count (int): このステータスのTodoの件数。<br>
+        assignees (List[BoardAssigneeCountSchema]): 担当者毎の件数。<br>
+    """
+
+    status: TaskStatus = Field(description="ステータス")
+    count: int = Field(description="件数")
+    assignees: List[BoardAssigneeCountSchema] = []
+
+
+class BoardColumnSchema(BoardColumnCountSchema):
+    """
+    ボードの1列(ステータス)です。<br>
+    <br>
+    Attributes:<br>
+        cards (List[TodoReadSchema]): 作成日時順で先頭のTodo。<br>
+    """
+
+    cards: List[TodoReadSchema] = []
+
+
+class BoardSchema(SQLModel):
+    """
+    カンバンボードの集計です。全てのステータスの列を、ステータス順で返します。
+    """
+
+    columns: List[BoardColumnSchema]
+
+
+class BoardCountsSchema(SQLModel):
+    """
+    ステータス・担当者毎のTodoの件数です。全てのステータスを、ステータス順で返します。
+    """
+
+    columns: List[BoardColumnCountSchema]
@@ -2,6 +2,7 @@ from enum import Enum as PyEnum
 from typing import Optional
 from uuid import UUID
 
+from sqlalchemy import Index
 from sqlmodel import Field, Relationship, SQLModel
 
 from models import BaseCreateSchema, BaseTable, BaseUpdateSchema
@@ -24,17 +25,34 @@ class TodoBase(SQLModel):
 
 
 class Todo(BaseTable, TodoBase, table=True):
+    __table_args__ = (
+        # 一覧のカーソルページネーション(created_at, id順)で使用するインデックス
+        Index("ix_todo_created_at_id", "created_at", "id"),
+        Index("ix_todo_status_created_at_id", "status", "created_at", "id"),
+        # 担当者での絞り込み(ユーザーのTodo一覧・担当Todoのselectin)と、その作成日時順
+        Index("ix_todo_assignee_id_created_at_id", "assignee_id", "created_at", "id"),
+        # 状態・担当者毎の件数の集計
+        Index("ix_todo_status_assignee_id", "status", "assignee_id"),
+        # タイトル・説明の全文検索。日本語は単語が空白で区切られないためngramパーサーを使用する
+        Index(
+            "ix_todo_title_description_fulltext",
+            "title",
+            "description",
+            mysql_prefix="FULLTEXT",
+            mysql_with_parser="ngram",
+        ),
+    )
 
     assignee_id: Optional[UUID] = Field(
         default=None, foreign_key="user.id", description="担当者"
     )
 
     creator_id: Optional[UUID] = Field(
-        default=None, foreign_key="user.id", description="作成者"
+        default=None, foreign_key="user.id", index=True, description="作成者"
     )
 
     updater_id: Optional[UUID] = Field(
-        default=None, foreign_key="user.id", description="更新者"
+        default=None, foreign_key="user.id", index=True, description="更新者"
     )
     assignee: Optional["User"] = Relationship(  # noqa: F821
         back_populates="assigned_todos",
@@ -52,6 +70,26 @@ class Todo(BaseTable, TodoBase, table=True):
     )
 
 
+# 件数のテーブルで、担当者が未割り当てのTodoを表すID。主キーにNULLは使用できないため代わりに使用する
+UNASSIGNED = UUID(int=0)
+
+
+class TodoStatusCount(SQLModel, table=True):
+    """
+    ステータス・担当者毎のTodoの件数です。<br>
+    TodoCRUDでTodoを作成・更新・削除する際に、同じトランザクションで増減させます。<br>
+    CRUDを経由しない変更との差異は、TodoCRUD.reconcile_status_countsで集計し直します。
+    """
+
+    __tablename__ = "todo_status_count"
+
+    status: TaskStatus = Field(primary_key=True, description="ステータス")
+    assignee_id: UUID = Field(
+        primary_key=True, description="担当者 未割り当ての場合はUNASSIGNED"
+    )
+    count: int = Field(default=0, nullable=False, description="件数")
+
+
 class TodoCreateSchema(BaseCreateSchema):
     """
     TodoCreateSchemaクラスは、新しいTodoを作成するためのスキーマです。<br>
@@ -106,6 +144,17 @@ class TodoReadWithTimestampsSchema(TodoBase):
     )
 
 
+class TodoExportSchema(TodoReadWithTimestampsSchema):
+    """
+    Todoのエクスポートで1行に出力する項目です。<br>
+    担当者・作成者・更新者はIDのみを出力します。
+    """
+
+    assignee_id: Optional[UUID] = None
+    creator_id: Optional[UUID] = None
+    updater_id: Optional[UUID] = None
+
+
 class TodoReadSchema(TodoReadWithTimestampsSchema):
     """
     TodoReadSchemaクラスは、Todoの読み取りスキーマを定義します。<br>
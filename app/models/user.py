@@ -2,6 +2,7 @@ from typing import List, Optional
 from uuid import UUID
 
 from pydantic import EmailStr
+from sqlalchemy import Index
 from sqlmodel import Field, Relationship, SQLModel
 
 from models import BaseCreateSchema, BaseTable, BaseUpdateSchema
@@ -16,6 +17,10 @@ class UserBase(SQLModel):
 
 
 class User(BaseTable, UserBase, table=True):
+    __table_args__ = (
+        # 一覧のカーソルページネーション(created_at, id順)で使用するインデックス
+        Index("ix_user_created_at_id", "created_at", "id"),
+    )
     assigned_todos: List["Todo"] = Relationship(  # noqa: F821
         back_populates="assignee",
         sa_relationship_kwargs={
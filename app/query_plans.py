@@ -0,0 +1,140 @@
+from contextvars import ContextVar
+from threading import Lock
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from config import settings
+from dependencies.database import engine, sync_engines
+
+# リクエスト中に発行されたSQLとパラメーター。計測中のリクエスト以外ではNone
+_captured: ContextVar[Optional[List[Tuple[str, Any]]]] = ContextVar(
+    "captured_statements", default=None
+)
+
+# EXPLAINで実行計画を取得できる文
+EXPLAINABLE = ("SELECT", "UPDATE", "DELETE")
+
+
+def analyze_plan(plan: Sequence[Dict[str, Any]]) -> Dict[str, List[str]]:
+    """
+    MySQLのEXPLAINの結果から、フルスキャン(type=ALL)と
+    filesort・一時テーブルを使用しているテーブルを返します。
+    """
+    issues: Dict[str, List[str]] = {
+        "full_scans": [],
+        "filesorts": [],
+        "temporary_tables": [],
+    }
+    for row in plan:
+        table = row.get("table")
+        extra = row.get("Extra") or ""
+        if row.get("type") == "ALL":
+            issues["full_scans"].append(table)
+        if "Using filesort" in extra:
+            issues["filesorts"].append(table)
+        if "Using temporary" in extra:
+            issues["temporary_tables"].append(table)
+    return issues
+
+
+class QueryPlanAdvisor:
+    """
+    エンドポイント毎に発行されたSQLを重複を除いて記録し、
+    EXPLAINでインデックスを使用していないクエリを報告します。<br>
+    settings.query_plan_advisorが有効な場合のみ記録します。開発・検証環境向けの機能です。
+    """
+
+    def __init__(self, engine: Engine, enabled: bool = False) -> None:
+        self.engine = engine
+        self.enabled = enabled
+        # エンドポイント毎の{SQL: 最初に発行された際のパラメーター}
+        self.statements: Dict[str, Dict[str, Any]] = {}
+        self._lock = Lock()
+
+    def install(self, engine: Engine) -> None:
+        """
+        engineで発行されるSQLを記録するようにします。
+        """
+        event.listen(engine, "before_cursor_execute", self._capture)
+
+    def uninstall(self, engine: Engine) -> None:
+        event.remove(engine, "before_cursor_execute", self._capture)
+
+    def _capture(self, conn, cursor, statement, parameters, context, executemany):
+        captured = _captured.get()
+        if captured is not None and not executemany:
+            captured.append((statement, parameters))
+
+    def record(self, endpoint: str, statements: List[Tuple[str, Any]]) -> None:
+        with self._lock:
+            recorded = self.statements.setdefault(endpoint, {})
+            for statement, parameters in statements:
+                recorded.setdefault(statement, parameters)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.statements.clear()
+
+    def explain(self, statement: str, parameters: Any) -> List[Dict[str, Any]]:
+        # EXPLAIN自体は記録しない
+        token = _captured.set(None)
+        try:
+            with self.engine.connect() as conn:
+                result = conn.exec_driver_sql(f"EXPLAIN {statement}", parameters)
+                return [dict(row) for row in result.mappings()]
+        finally:
+            _captured.reset(token)
+
+    def report(self) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        記録したSQLをEXPLAINし、エンドポイント毎にSQL・検出した問題・実行計画を返します。
+        """
+        with self._lock:
+            statements = {
+                endpoint: dict(recorded)
+                for endpoint, recorded in self.statements.items()
+            }
+        report: Dict[str, List[Dict[str, Any]]] = {}
+        for endpoint, recorded in sorted(statements.items()):
+            for statement, parameters in recorded.items():
+                if not statement.lstrip().upper().startswith(EXPLAINABLE):
+                    continue
+                plan = self.explain(statement, parameters)
+                report.setdefault(endpoint, []).append(
+                    {"statement": statement, **analyze_plan(plan), "plan": plan}
+                )
+        return report
+
+
+class QueryPlanMiddleware:
+    """
+    リクエスト中に発行されたSQLを、ルートのパス(/todos/{id}など)毎に記録するミドルウェアです。
+    """
+
+    def __init__(self, app: ASGIApp, advisor: QueryPlanAdvisor) -> None:
+        self.app = app
+        self.advisor = advisor
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.advisor.enabled:
+            await self.app(scope, receive, send)
+            return
+        statements: List[Tuple[str, Any]] = []
+        token = _captured.set(statements)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _captured.reset(token)
+            route = scope.get("route")
+            if statements and route is not None:
+                endpoint = f"{scope['method']} {scope.get('root_path', '')}{route.path}"
+                self.advisor.record(endpoint, statements)
+
+
+query_plan_advisor = QueryPlanAdvisor(engine, enabled=settings.query_plan_advisor)
+if settings.query_plan_advisor:
+    for target in sync_engines():
+        query_plan_advisor.install(target)
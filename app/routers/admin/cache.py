@@ -0,0 +1,19 @@
+from fastapi import APIRouter, status
+
+from config import settings
+from cruds import CRUD
+
+router = APIRouter(
+    prefix="/cache",
+    tags=["cache"],
+)
+
+
+@router.get(
+    "/stats",
+    summary="キャッシュ統計取得",
+    description="エンティティキャッシュの件数とヒット・ミス・破棄の件数を取得する",
+    status_code=status.HTTP_200_OK,
+)
+async def read_cache_stats():
+    return {"enabled": settings.entity_cache_enabled, **CRUD.cache.stats()}
@@ -0,0 +1,32 @@
+from fastapi import APIRouter, status
+
+from dependencies.database import async_engine, engine, get_pool_status, replica_set
+
+router = APIRouter(
+    prefix="/database",
+    tags=["database"],
+)
+
+
+@router.get(
+    "/pool",
+    summary="コネクションプール状態取得",
+    description="プライマリ・レプリカのコネクションプールの使用中・待機中の接続数と、"
+    "接続の取得にかかった時間・タイムアウト回数、レプリカの状態を取得する",
+    status_code=status.HTTP_200_OK,
+)
+async def read_pool_status():
+    pools = {"sync": get_pool_status(engine.pool)}
+    if async_engine is not None:
+        pools["async"] = get_pool_status(async_engine.pool)
+    pools["replicas"] = []
+    for replica in replica_set.replicas:
+        replica_status = {
+            "host": replica.url.host,
+            "healthy": replica.healthy,
+            "sync": get_pool_status(replica.engine.pool),
+        }
+        if replica.async_engine is not None:
+            replica_status["async"] = get_pool_status(replica.async_engine.pool)
+        pools["replicas"].append(replica_status)
+    return pools
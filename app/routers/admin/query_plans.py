@@ -0,0 +1,35 @@
+from fastapi import APIRouter, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+
+from query_plans import query_plan_advisor
+
+router = APIRouter(
+    prefix="/query-plans",
+    tags=["query-plans"],
+)
+
+
+@router.get(
+    "",
+    summary="実行計画レポート取得",
+    description="エンドポイント毎に発行されたSQLをEXPLAINし、"
+    "フルスキャン・filesort・一時テーブルを使用しているテーブルを返す",
+    status_code=status.HTTP_200_OK,
+)
+async def read_query_plans():
+    if not query_plan_advisor.enabled:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Query plan advisor is disabled",
+        )
+    return await run_in_threadpool(query_plan_advisor.report)
+
+
+@router.delete(
+    "",
+    summary="実行計画レポート削除",
+    description="記録したSQLを削除する",
+    status_code=status.HTTP_204_NO_CONTENT,
+)
+async def delete_query_plans():
+    query_plan_advisor.clear()
@@ -0,0 +1,22 @@
+from fastapi import APIRouter, Depends, status
+from sqlmodel import Session
+
+from cruds.todo_crud import TodoAsyncCRUD
+from dependencies.database import get_session
+
+router = APIRouter(
+    prefix="/todo-counts",
+    tags=["todo-counts"],
+)
+
+
+@router.post(
+    ":reconcile",
+    summary="件数の再集計",
+    description="ステータス・担当者毎のTodoの件数のテーブルを、Todoから集計し直す。"
+    "件数が異なっていた組み合わせの数を返す",
+    status_code=status.HTTP_200_OK,
+)
+async def reconcile_todo_counts(*, session: Session = Depends(get_session)):
+    corrected = await TodoAsyncCRUD(session).reconcile_status_counts()
+    return {"corrected": corrected}
@@ -0,0 +1,75 @@
+from typing import Any, Dict, Iterable, Optional, Tuple
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, Query, status
+from sqlmodel import Session
+
+from cruds.todo_crud import TodoAsyncCRUD
+from dependencies.database import get_session
+from instrumentation import InstrumentedRoute
+from models.board import BoardCountsSchema, BoardSchema
+from models.todo import TaskStatus
+
+router = APIRouter(
+    prefix="/board",
+    tags=["board"],
+    route_class=InstrumentedRoute,
+)
+
+
+def build_columns(
+    counts: Iterable[Tuple[TaskStatus, Optional[UUID], int]]
+) -> Dict[TaskStatus, Dict[str, Any]]:
+    """
+    ステータス・担当者毎の件数から、全てのステータスの列を作成します。
+    """
+    columns = {
+        task_status: {"status": task_status, "count": 0, "assignees": []}
+        for task_status in TaskStatus
+    }
+    for task_status, assignee_id, count in counts:
+        columns[task_status]["count"] += count
+        columns[task_status]["assignees"].append(
+            {"assignee_id": assignee_id, "count": count}
+        )
+    return columns
+
+
+@router.get(
+    "",
+    response_model=BoardSchema,
+    summary="ボード取得",
+    description="ステータス毎・ステータスと担当者毎のTodoの件数と、"
+    "各ステータスの作成日時順で先頭のTodoを取得する",
+    status_code=status.HTTP_200_OK,
+)
+async def read_board(
+    *,
+    session: Session = Depends(get_session),
+    limit: int = Query(
+        default=20, description="各ステータスで取得するTodoの件数", ge=0, le=100
+    ),
+):
+    todo_crud = TodoAsyncCRUD(session)
+    counts = await todo_crud.count_by_status_and_assignee()
+    cards = await todo_crud.first_by_status(limit)
+
+    columns = build_columns(counts)
+    for column in columns.values():
+        column["cards"] = []
+    for card in cards:
+        columns[card.status]["cards"].append(card)
+    return {"columns": list(columns.values())}
+
+
+@router.get(
+    "/counts",
+    response_model=BoardCountsSchema,
+    summary="件数取得",
+    description="ステータス毎・ステータスと担当者毎のTodoの件数を、"
+    "Todoの作成・更新・削除時に更新している件数のテーブルから取得する",
+    status_code=status.HTTP_200_OK,
+)
+async def read_board_counts(*, session: Session = Depends(get_session)):
+    counts = await TodoAsyncCRUD(session).status_counts()
+    return {"columns": list(build_columns(counts).values())}
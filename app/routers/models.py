@@ -5,10 +5,12 @@ from fastapi import APIRouter, Depends, status
 from sqlmodel import Session
 
 from dependencies.database import get_session
+from instrumentation import InstrumentedRoute
 
 router = APIRouter(
     prefix="/models",
     tags=["models"],
+    route_class=InstrumentedRoute,
 )
 
 
@@ -1,19 +1,98 @@
-from typing import List, Optional
+import csv
+import io
+from enum import Enum
+from typing import Any, AsyncIterator, Dict, List, Optional
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, Query, status
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
+from sqlalchemy.orm import lazyload
 from sqlmodel import Session, select
 
-from cruds.todo_crud import TodoCRUD
+from config import settings
+from cruds import NEXT_CURSOR_HEADER
+from cruds.todo_crud import TodoAsyncCRUD
+from dependencies.conditional import ETAG_HEADER, ConditionalRequest
 from dependencies.database import get_session
-from models.todo import Todo, TodoCreateSchema, TodoReadSchema, TodoUpdateSchema
+from dependencies.fields import Projection, todo_fields
+from instrumentation import InstrumentedRoute
+from models import BulkItemResult, BulkOperationResult
+from models.todo import (
+    TaskStatus,
+    Todo,
+    TodoCreateSchema,
+    TodoExportSchema,
+    TodoReadSchema,
+    TodoUpdateSchema,
+)
 
 router = APIRouter(
     prefix="/todos",
     tags=["todos"],
+    route_class=InstrumentedRoute,
 )
 
 
+def parse_status(value: str) -> TaskStatus:
+    try:
+        return TaskStatus(int(value)) if value.isdigit() else TaskStatus[value]
+    except (KeyError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid status"
+        )
+
+
+class ExportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+todo_export_adapter = TypeAdapter(TodoExportSchema)
+
+
+async def ndjson_lines(partitions: AsyncIterator[List[Todo]]) -> AsyncIterator[bytes]:
+    async for todos in partitions:
+        yield b"".join(
+            todo_export_adapter.dump_json(
+                todo_export_adapter.validate_python(todo, from_attributes=True)
+            )
+            + b"\n"
+            for todo in todos
+        )
+
+
+async def csv_lines(partitions: AsyncIterator[List[Todo]]) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(TodoExportSchema.model_fields))
+    writer.writeheader()
+    async for todos in partitions:
+        for todo in todos:
+            row = todo_export_adapter.validate_python(todo, from_attributes=True)
+            writer.writerow(todo_export_adapter.dump_python(row, mode="json"))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def todo_filters(
+    status: Optional[str] = Query(
+        default=None, description="ステータス(1〜3 または TODO DOING DONE)"
+    ),
+    assignee_id: Optional[UUID] = Query(default=None, description="担当者"),
+) -> List[Any]:
+    """
+    Todoの一覧・一括操作で共通の絞り込み条件を返します。
+    """
+    filters = []
+    if status is not None:
+        filters.append(Todo.status == parse_status(status))
+    if assignee_id is not None:
+        filters.append(Todo.assignee_id == assignee_id)
+    return filters
+
+
 @router.post(
     "",
     response_model=Todo,
@@ -21,54 +100,195 @@ router = APIRouter(
     description="新しいTodoを作成する",
     status_code=status.HTTP_201_CREATED,
 )
-def create_todo(
+async def create_todo(
     *,
     todo: TodoCreateSchema,
     session: Session = Depends(get_session),
 ):
 
-    todo_crud = TodoCRUD(session)
+    todo_crud = TodoAsyncCRUD(session)
 
-    created_todo = todo_crud.create(todo)
+    created_todo = await todo_crud.create(todo)
     return created_todo
 
 
+@router.post(
+    ":bulk",
+    response_model=List[BulkItemResult],
+    summary="Todo一括作成",
+    description="複数のTodoを1つのトランザクションで作成し、要素毎の結果を返す",
+    status_code=status.HTTP_200_OK,
+)
+async def bulk_create_todos(
+    *,
+    todos: List[Dict[str, Any]] = Body(
+        description="作成するTodo(TodoCreateSchema)のリスト"
+    ),
+    batch_size: int = Query(
+        default=settings.bulk_batch_size,
+        description="1回のINSERTで作成する件数",
+        ge=1,
+        le=5000,
+    ),
+    session: Session = Depends(get_session),
+):
+    todo_crud = TodoAsyncCRUD(session)
+    return await todo_crud.bulk_create(todos, batch_size)
+
+
 @router.get(
     "",
     response_model=List[TodoReadSchema],
     summary="Todo一覧取得",
-    description="Todoの一覧を取得する",
+    description="Todoの一覧を作成日時順に取得する。"
+    "次のページがある場合は、そのカーソルをX-Next-Cursorヘッダーで返す",
     status_code=status.HTTP_200_OK,
 )
 async def read_todos(
     *,
     session: Session = Depends(get_session),
+    response: Response,
     offset: int = Query(default=0, description="オフセット", ge=0),
     limit: int = Query(default=100, description="リミット", ge=1, le=100),
-    status: Optional[str] = Query(default=None, description="ステータス"),
+    cursor: Optional[str] = Query(
+        default=None, description="カーソル(指定した場合オフセットは無視される)"
+    ),
+    filters: List[Any] = Depends(todo_filters),
+    projection: Projection = Depends(todo_fields),
 ):
-    query = select(Todo).offset(offset).limit(limit)
-    if status is not None:
-        query = query.where(Todo.status == int(status))
-    todos = session.exec(query).all()
-    return todos
+    query = select(Todo).where(*filters)
+    todo_crud = TodoAsyncCRUD(session)
+    todos, next_cursor = await todo_crud.page(
+        query, limit, offset, cursor, projection.options()
+    )
+    if next_cursor is not None:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return projection.render(todos, response.headers)
+
+
+@router.get(
+    "/export",
+    summary="Todoエクスポート",
+    description="条件に一致する全てのTodoを、NDJSONまたはCSVでストリーミングして返す",
+    response_class=StreamingResponse,
+    status_code=status.HTTP_200_OK,
+)
+async def export_todos(
+    *,
+    export_format: ExportFormat = Query(
+        default=ExportFormat.ndjson, alias="format", description="出力形式"
+    ),
+    filters: List[Any] = Depends(todo_filters),
+    session: Session = Depends(get_session),
+):
+    todo_crud = TodoAsyncCRUD(session)
+    query = select(Todo).where(*filters).order_by(Todo.created_at, Todo.id)
+    partitions = todo_crud.stream(
+        query, settings.export_yield_per, options=[lazyload("*")]
+    )
+    if export_format is ExportFormat.csv:
+        content, media_type = csv_lines(partitions), "text/csv; charset=utf-8"
+    else:
+        content, media_type = ndjson_lines(partitions), "application/x-ndjson"
+    return StreamingResponse(
+        content,
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="todos.{export_format.value}"'
+        },
+    )
+
+
+@router.get(
+    "/search",
+    response_model=List[TodoReadSchema],
+    summary="Todo検索",
+    description="タイトル・説明に、空白で区切った全ての語を含むTodoを関連度の高い順に取得する",
+    status_code=status.HTTP_200_OK,
+)
+async def search_todos(
+    *,
+    q: str = Query(description="検索文字列", min_length=1, max_length=256),
+    offset: int = Query(default=0, description="オフセット", ge=0),
+    limit: int = Query(default=20, description="リミット", ge=1, le=100),
+    filters: List[Any] = Depends(todo_filters),
+    session: Session = Depends(get_session),
+):
+    todo_crud = TodoAsyncCRUD(session)
+    return await todo_crud.search(q, filters, limit, offset)
+
+
+@router.patch(
+    "",
+    response_model=BulkOperationResult,
+    summary="Todo一括更新",
+    description="条件に一致するTodoを1回のUPDATEで更新し、更新件数を返す",
+    status_code=status.HTTP_200_OK,
+)
+async def bulk_update_todos(
+    *,
+    todo_update: TodoUpdateSchema,
+    filters: List[Any] = Depends(todo_filters),
+    session: Session = Depends(get_session),
+):
+    if not filters:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Filter is required"
+        )
+    todo_crud = TodoAsyncCRUD(session)
+    count = await todo_crud.update_where(filters, todo_update)
+    return BulkOperationResult(count=count)
+
+
+@router.delete(
+    "",
+    response_model=BulkOperationResult,
+    summary="Todo一括削除",
+    description="条件に一致するTodoを1回のDELETEで削除し、削除件数を返す",
+    status_code=status.HTTP_200_OK,
+)
+async def bulk_delete_todos(
+    *,
+    filters: List[Any] = Depends(todo_filters),
+    session: Session = Depends(get_session),
+):
+    if not filters:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Filter is required"
+        )
+    todo_crud = TodoAsyncCRUD(session)
+    count = await todo_crud.delete_where(filters)
+    return BulkOperationResult(count=count)
 
 
 @router.get(
     "/{id}",
     response_model=TodoReadSchema,
     summary="Todo取得",
-    description="指定したIDのTodoを取得する",
+    description="指定したIDのTodoを取得する。"
+    "If-None-MatchヘッダーのETagが一致する場合は304を返す",
     status_code=status.HTTP_200_OK,
 )
 async def read_todo(
     *,
     id: UUID,
     session: Session = Depends(get_session),
+    response: Response,
+    projection: Projection = Depends(todo_fields),
+    conditional: ConditionalRequest = Depends(),
 ):
 
-    todo_crud = TodoCRUD(session)
-    return todo_crud.get(id)
+    todo_crud = TodoAsyncCRUD(session)
+    if projection.is_default:
+        todo = await todo_crud.get_cached(id)
+    else:
+        todo = await todo_crud.get(id, projection.options())
+    # revisionは書き込み毎に変わるため、同じ秒の更新や担当者などの更新でもETagが変わる
+    etag, content = projection.etag_of(id, todo)
+    if conditional.matches(etag):
+        return conditional.not_modified(etag)
+    response.headers[ETAG_HEADER] = etag
+    return projection.render(todo, response.headers, content)
 
 
 @router.patch(
@@ -83,8 +303,8 @@ async def update_todo(
     todo_update: TodoUpdateSchema,
     session: Session = Depends(get_session),
 ):
-    todo_crud = TodoCRUD(session)
-    todo_crud.update(id, todo_update)
+    todo_crud = TodoAsyncCRUD(session)
+    await todo_crud.update(id, todo_update, refresh=False)
 
 
 @router.delete(
@@ -99,5 +319,5 @@ async def delete_todo(
     session: Session = Depends(get_session),
 ):
 
-    todo_crud = TodoCRUD(session)
-    todo_crud.delete(id)
+    todo_crud = TodoAsyncCRUD(session)
+    await todo_crud.delete(id)
@@ -1,17 +1,25 @@
-from typing import List
+from typing import Any, Dict, List, Optional
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, Query, status
+from fastapi import APIRouter, Body, Depends, Query, Response, status
 from sqlmodel import Session, select
 
-from cruds.user_crud import UserCRUD
+from config import settings
+from cruds import NEXT_CURSOR_HEADER
+from cruds.todo_crud import TodoAsyncCRUD, user_todos_cache_key
+from cruds.user_crud import UserAsyncCRUD
+from dependencies.conditional import ETAG_HEADER, ConditionalRequest
 from dependencies.database import get_session
+from dependencies.fields import Projection, todo_fields, user_fields
+from instrumentation import InstrumentedRoute
+from models import BulkItemResult
 from models.todo import Todo, TodoReadSchema, UserReadWithTodosSchema
 from models.user import User, UserCreateSchema, UserUpdateSchema
 
 router = APIRouter(
     prefix="/users",
     tags=["users"],
+    route_class=InstrumentedRoute,
 )
 
 
@@ -22,34 +30,68 @@ router = APIRouter(
     description="新しいUserを作成する",
     status_code=status.HTTP_201_CREATED,
 )
-def create_user(
+async def create_user(
     *,
     user: UserCreateSchema,
     session: Session = Depends(get_session),
 ):
 
-    user_crud = UserCRUD(session)
+    user_crud = UserAsyncCRUD(session)
 
-    created_user = user_crud.create(user)
+    created_user = await user_crud.create(user)
     return created_user
 
 
+@router.post(
+    ":bulk",
+    response_model=List[BulkItemResult],
+    summary="User一括作成",
+    description="複数のUserを1つのトランザクションで作成し、要素毎の結果を返す",
+    status_code=status.HTTP_200_OK,
+)
+async def bulk_create_users(
+    *,
+    users: List[Dict[str, Any]] = Body(
+        description="作成するUser(UserCreateSchema)のリスト"
+    ),
+    batch_size: int = Query(
+        default=settings.bulk_batch_size,
+        description="1回のINSERTで作成する件数",
+        ge=1,
+        le=5000,
+    ),
+    session: Session = Depends(get_session),
+):
+    user_crud = UserAsyncCRUD(session)
+    return await user_crud.bulk_create(users, batch_size)
+
+
 @router.get(
     "",
     response_model=List[UserReadWithTodosSchema],
     summary="User一覧取得",
-    description="Userの一覧を取得する",
+    description="Userの一覧を作成日時順に取得する。"
+    "次のページがある場合は、そのカーソルをX-Next-Cursorヘッダーで返す",
     status_code=status.HTTP_200_OK,
 )
 async def read_users(
     *,
     session: Session = Depends(get_session),
+    response: Response,
     offset: int = Query(default=0, description="オフセット", ge=0),
     limit: int = Query(default=100, description="リミット", ge=1, le=100),
+    cursor: Optional[str] = Query(
+        default=None, description="カーソル(指定した場合オフセットは無視される)"
+    ),
+    projection: Projection = Depends(user_fields),
 ):
-    query = select(User).offset(offset).limit(limit)
-    users = session.exec(query).all()
-    return users
+    user_crud = UserAsyncCRUD(session)
+    users, next_cursor = await user_crud.page(
+        select(User), limit, offset, cursor, projection.options()
+    )
+    if next_cursor is not None:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return projection.render(users, response.headers)
 
 
 @router.get(
@@ -63,10 +105,13 @@ async def read_user(
     *,
     id: UUID,
     session: Session = Depends(get_session),
+    projection: Projection = Depends(user_fields),
 ):
 
-    user_crud = UserCRUD(session)
-    return user_crud.get(id)
+    user_crud = UserAsyncCRUD(session)
+    if projection.is_default:
+        return projection.render(await user_crud.get_cached(id))
+    return projection.render(await user_crud.get(id, projection.options()))
 
 
 @router.patch(
@@ -81,8 +126,8 @@ async def update_user(
     user_update: UserUpdateSchema,
     session: Session = Depends(get_session),
 ):
-    user_crud = UserCRUD(session)
-    user_crud.update(id, user_update)
+    user_crud = UserAsyncCRUD(session)
+    await user_crud.update(id, user_update, refresh=False)
 
 
 @router.delete(
@@ -97,20 +142,43 @@ async def delete_user(
     session: Session = Depends(get_session),
 ):
 
-    user_crud = UserCRUD(session)
-    user_crud.delete(id)
+    user_crud = UserAsyncCRUD(session)
+    await user_crud.delete(id)
 
 
 @router.get(
     "/{user_id}/todos",
     response_model=List[TodoReadSchema],
     summary="ユーザーの全てのTodoを取得",
-    description="指定したユーザーIDに関連する全てのTodoを取得する",
+    description="指定したユーザーIDに関連する全てのTodoを取得する。"
+    "If-None-MatchヘッダーのETagが一致する場合は304を返す",
 )
 async def get_user_todos(
     *,
     user_id: UUID,
     session: Session = Depends(get_session),
+    response: Response,
+    projection: Projection = Depends(todo_fields),
+    conditional: ConditionalRequest = Depends(),
 ):
-    todos = session.exec(select(Todo).where(Todo.assignee_id == user_id)).all()
-    return todos
+    todo_crud = TodoAsyncCRUD(session)
+    where = [Todo.assignee_id == user_id]
+    if conditional.if_none_match is not None:
+        # 件数と、Todo・埋め込む担当者などのrevisionの合計だけを集計し、
+        # 変更が無ければ一覧を読み込まない
+        fingerprint = await todo_crud.fingerprint(where, sorted(projection.include))
+        etag = projection.etag(user_id, *fingerprint)
+        if conditional.matches(etag):
+            return conditional.not_modified(etag)
+
+    statement = select(Todo).where(*where)
+    if projection.is_default:
+        todos = await todo_crud.all_cached(user_todos_cache_key(user_id), statement)
+    else:
+        todos = await todo_crud.all(statement, projection.options())
+    etag, content = projection.etag_of(user_id, todos)
+    # キャッシュから返す一覧は、内容から作成したETagで判定する
+    if conditional.matches(etag):
+        return conditional.not_modified(etag)
+    response.headers[ETAG_HEADER] = etag
+    return projection.render(todos, response.headers, content)
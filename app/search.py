@@ -0,0 +1,124 @@
+import math
+import unicodedata
+from collections import Counter
+from threading import Lock
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+# MySQLのngram_token_sizeの既定値。FULLTEXTインデックスと同じ長さで分割する
+NGRAM_TOKEN_SIZE = 2
+
+# MySQLのBOOLEAN MODEで演算子として扱われる文字
+BOOLEAN_OPERATORS = '+-<>()~*"@'
+
+
+def normalize(text: str) -> str:
+    """
+    全角・半角と大文字・小文字を区別しないように、文字列を正規化します。
+    """
+    return unicodedata.normalize("NFKC", text).casefold()
+
+
+def search_terms(q: str, n: int = NGRAM_TOKEN_SIZE) -> List[str]:
+    """
+    検索文字列を空白で区切り、正規化した語のリストを返します。<br>
+    前方一致で検索するn文字未満の語のうち、演算子の文字を含む語は無視します。
+    """
+    terms = []
+    for term in normalize(q).split():
+        term = term.replace('"', "")
+        if len(term) < n and any(char in BOOLEAN_OPERATORS for char in term):
+            continue
+        if term and term not in terms:
+            terms.append(term)
+    return terms
+
+
+def ngrams(text: str, n: int = NGRAM_TOKEN_SIZE) -> List[str]:
+    """
+    MySQLのngramパーサーと同様に、空白を含まないn文字ずつのトークンに分割します。
+    n文字未満の語はトークンになりません。
+    """
+    return [word[i : i + n] for word in text.split() for i in range(len(word) - n + 1)]
+
+
+def boolean_query(q: str, n: int = NGRAM_TOKEN_SIZE) -> str:
+    """
+    検索文字列を、全ての語を含む行に一致するBOOLEAN MODEの検索式に変換します。<br>
+    n文字以上の語はフレーズ(ngramが連続する行)として、n文字未満の語は前方一致で検索します。
+    """
+    return " ".join(
+        f'+"{term}"' if len(term) >= n else f"+{term}*" for term in search_terms(q, n)
+    )
+
+
+class InvertedIndex:
+    """
+    ngramのトークンからドキュメントを引く、プロセス内の転置インデックスです。<br>
+    MySQLのFULLTEXTインデックスを使用できない環境(SQLiteでのテストなど)で、
+    boolean_queryと同じ条件(全ての語を部分文字列として含む)で検索します。
+    """
+
+    def __init__(self, n: int = NGRAM_TOKEN_SIZE) -> None:
+        self.n = n
+        # 作成元のデータの版。版が変わった場合は作り直す
+        self.version: Any = None
+        self.documents: Dict[Hashable, str] = {}
+        # {トークン: {キー: トークンの出現回数}}
+        self.postings: Dict[str, Dict[Hashable, int]] = {}
+        self._lock = Lock()
+
+    def rebuild(
+        self,
+        documents: Iterable[Tuple[Hashable, Sequence[Optional[str]]]],
+        version: Any,
+    ) -> None:
+        """
+        (キー, 項目のリスト)からインデックスを作り直します。
+        """
+        texts: Dict[Hashable, str] = {}
+        postings: Dict[str, Dict[Hashable, int]] = {}
+        for key, fields in documents:
+            text = normalize(" ".join(field for field in fields if field))
+            texts[key] = text
+            for token, count in Counter(ngrams(text, self.n)).items():
+                postings.setdefault(token, {})[key] = count
+        with self._lock:
+            self.documents, self.postings, self.version = texts, postings, version
+
+    def expire(self) -> None:
+        """
+        作成元のデータが変更されたことを記録し、次の検索の前に作り直させます。
+        """
+        self.version = None
+
+    def search(self, q: str) -> List[Hashable]:
+        """
+        全ての語を含むドキュメントのキーを、関連度の高い順に返します。<br>
+        関連度はMySQLと同様に、トークン毎の出現回数×IDF²の合計です。
+        """
+        with self._lock:
+            documents, postings = self.documents, self.postings
+        terms = search_terms(q, self.n)
+        if not terms:
+            return []
+        candidates: Optional[set] = None
+        scores: Counter = Counter()
+        for term in terms:
+            tokens = ngrams(term, self.n)
+            if tokens:
+                # 全てのトークンを含むドキュメントに絞り込んでから、語が連続しているかを確認する
+                keys = set.intersection(
+                    *(set(postings.get(token, ())) for token in tokens)
+                )
+            else:
+                keys = set(documents)
+            keys = {key for key in keys if term in documents[key]}
+            candidates = keys if candidates is None else candidates & keys
+            if not candidates:
+                return []
+            for token in tokens:
+                matched = postings[token]
+                idf = math.log10((len(documents) + 1) / len(matched))
+                for key in keys:
+                    scores[key] += matched[key] * idf * idf
+        return sorted(candidates, key=lambda key: (-scores[key], str(key)))
@@ -1,11 +1,12 @@
 import sys
+from contextlib import contextmanager
 from os.path import abspath, dirname
 from typing import Any, Generator
 
 import pytest
 from fastapi import FastAPI
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.engine.url import URL
 from sqlalchemy_utils import create_database, database_exists
 from sqlmodel import Session, SQLModel, delete
@@ -15,9 +16,10 @@ sys.path.append(dirname(dirname(abspath(__file__))))
 from factory.alchemy import SQLAlchemyModelFactory  # noqa: E402
 
 from config import settings  # noqa: E402
+from cruds import CRUD  # noqa: E402
 from dependencies.database import get_session  # noqa: E402
-from main import app  # noqa: E402
-from models.todo import Todo  # noqa
+from main import admin_api, app  # noqa: E402
+from models.todo import Todo, TodoStatusCount  # noqa
 from models.user import User  # noqa
 
 engine = create_engine(
@@ -66,13 +68,62 @@ def db_session(db_engine) -> Generator[Session, Any, None]:
 
         # テスト後の処理: データベースのデータをクリア
         # 外部キーの制約エラーの為、手動で削除の順番を制御する
-        for model_class in [Todo, User]:
+        for model_class in [TodoStatusCount, Todo, User]:
             session.execute(delete(model_class))
         # for table in list(SQLModel.metadata.tables.values()):
         #     session.execute(table.delete())
         session.commit()
 
 
+@pytest.fixture
+def capture_queries(db_engine):
+    """
+    with文の中で発行されたSQLをリストに記録します。
+    """
+
+    @contextmanager
+    def _capture_queries():
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db_engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(db_engine, "before_cursor_execute", before_cursor_execute)
+
+    return _capture_queries
+
+
+@pytest.fixture
+def assert_num_queries(capture_queries):
+    """
+    with文の中で発行されたSQLの数が期待する数と一致することを検証します。
+    N+1問題などによるクエリ数の増加を検出するために使用します。
+    """
+
+    @contextmanager
+    def _assert_num_queries(expected: int):
+        with capture_queries() as statements:
+            yield statements
+        assert len(statements) == expected, "\n\n".join(statements)
+
+    return _assert_num_queries
+
+
+@pytest.fixture
+def entity_cache(monkeypatch):
+    """
+    エンティティキャッシュを有効にし、テストの前後でキャッシュを空にします。
+    """
+    monkeypatch.setattr(settings, "entity_cache_enabled", True)
+    CRUD.cache.clear()
+    yield CRUD.cache
+    CRUD.cache.clear()
+
+
 @pytest.fixture
 def auth_headers():
     return {"Authorization": "expected_token"}
@@ -93,7 +144,14 @@ def client(
         finally:
             pass
 
-    test_app.dependency_overrides[get_session] = _get_test_db
-    with TestClient(test_app) as client:
-        client.headers.update(auth_headers)
-        yield client
+    # /adminにマウントした管理者用APIは別のアプリのため、同じセッションに差し替える
+    apps = [test_app, admin_api]
+    for api in apps:
+        api.dependency_overrides[get_session] = _get_test_db
+    try:
+        with TestClient(test_app) as client:
+            client.headers.update(auth_headers)
+            yield client
+    finally:
+        for api in apps:
+            api.dependency_overrides.pop(get_session, None)
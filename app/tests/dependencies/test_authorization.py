@@ -0,0 +1,290 @@
+import asyncio
+import json
+import time
+
+import boto3
+import jwt
+import pytest
+from botocore.exceptions import ClientError
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import HTTPException, status
+from jwt.algorithms import RSAAlgorithm
+from pydantic import ValidationError
+
+from config import Settings, settings
+from dependencies import authorization
+from dependencies.authorization import (
+    JWKSCache,
+    get_issuer,
+    get_user_from_token,
+    get_user_from_token_async,
+    token_cache,
+    token_lookups,
+)
+
+
+class FakeCognito:
+    """
+    テスト用のCognitoスタブです。呼び出し回数を記録します。
+    """
+
+    def __init__(self, users: dict):
+        self.users = users
+        self.calls = 0
+
+    def get_user(self, AccessToken):
+        self.calls += 1
+        if AccessToken not in self.users:
+            raise ClientError({"Error": {"Code": "NotAuthorizedException"}}, "GetUser")
+        return {"Username": self.users[AccessToken]}
+
+    def admin_get_user(self, UserPoolId, Username):
+        return {
+            "UserAttributes": [
+                {"Name": "email", "Value": f"{Username}@example.com"},
+                {"Name": "custom:role", "Value": "admin"},
+            ]
+        }
+
+
+@pytest.fixture
+def cognito(monkeypatch):
+    fake = FakeCognito({"valid-token": "taro"})
+    monkeypatch.setattr(authorization, "get_cognito_client", lambda: fake)
+    token_cache.clear()
+    yield fake
+    token_cache.clear()
+
+
+def test_get_user_from_token_is_cached(cognito):
+    user = get_user_from_token("Bearer valid-token", "pool")
+    assert user == {"user_id": "taro", "email": "taro@example.com", "role": "admin"}
+
+    # 2回目はキャッシュから返され、Cognitoは呼び出されない
+    assert get_user_from_token("Bearer valid-token", "pool") == user
+    assert cognito.calls == 1
+    assert token_cache.hits == 1
+    assert token_cache.misses == 1
+
+
+def test_get_user_from_token_negative_cache(cognito):
+    for _ in range(3):
+        with pytest.raises(HTTPException) as e:
+            get_user_from_token("Bearer invalid-token", "pool")
+        assert e.value.status_code == status.HTTP_401_UNAUTHORIZED
+
+    assert cognito.calls == 1
+
+
+def test_get_user_from_token_lru_eviction(cognito, monkeypatch):
+    monkeypatch.setattr(token_cache, "maxsize", 1)
+    cognito.users["other-token"] = "hanako"
+
+    get_user_from_token("Bearer valid-token", "pool")
+    get_user_from_token("Bearer other-token", "pool")
+    get_user_from_token("Bearer valid-token", "pool")
+
+    assert cognito.calls == 3
+    assert token_cache.evictions == 2
+
+
+def test_get_user_from_token_expired(cognito, monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(token_cache, "timer", lambda: now[0])
+
+    get_user_from_token("Bearer valid-token", "pool")
+    now[0] += token_cache.ttl + 1
+    get_user_from_token("Bearer valid-token", "pool")
+
+    assert cognito.calls == 2
+
+
+@pytest.fixture
+def rsa_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+@pytest.fixture
+def jwks(monkeypatch, rsa_key, cognito):
+    """
+    ローカルで生成した鍵のJWKSを返すようにjwks_cacheを差し替えます。
+    """
+    keys = {"kid-1": rsa_key}
+    fetches = []
+
+    def fetch(url):
+        fetches.append(url)
+        return {
+            "keys": [
+                {**json.loads(RSAAlgorithm.to_jwk(key.public_key())), "kid": kid}
+                for kid, key in keys.items()
+            ]
+        }
+
+    monkeypatch.setattr(authorization.settings, "auth_mode", "jwt")
+    monkeypatch.setattr(authorization.settings, "cognito_app_client_ids", ["app"])
+    monkeypatch.setattr(
+        authorization,
+        "jwks_cache",
+        JWKSCache(
+            url="https://example.com/jwks.json", refresh_interval=3600, fetch=fetch
+        ),
+    )
+    return keys, fetches
+
+
+def make_token(key, kid="kid-1", **claims):
+    payload = {
+        "iss": get_issuer("pool"),
+        "exp": int(time.time()) + 60,
+        "token_use": "access",
+        "client_id": "app",
+        "username": "taro",
+        **claims,
+    }
+    return jwt.encode(payload, key, algorithm="RS256", headers={"kid": kid})
+
+
+@pytest.mark.parametrize("expires_in", [5, -1])
+def test_get_user_from_token_cache_capped_at_exp(
+    cognito, rsa_key, monkeypatch, expires_in
+):
+    now = [0.0]
+    monkeypatch.setattr(token_cache, "timer", lambda: now[0])
+    token = make_token(rsa_key, exp=int(time.time()) + expires_in)
+    cognito.users[token] = "taro"
+
+    get_user_from_token(f"Bearer {token}", "pool")
+    # expを過ぎると、token_cache.ttl内でもCognitoに問い合わせ直す
+    now[0] += max(expires_in, 0) + 1
+    assert now[0] < token_cache.ttl
+    get_user_from_token(f"Bearer {token}", "pool")
+
+    assert cognito.calls == 2
+
+
+def test_verify_access_token_locally(cognito, jwks, rsa_key):
+    token = make_token(rsa_key)
+
+    user = get_user_from_token(f"Bearer {token}", "pool", with_attributes=False)
+    assert user == {"user_id": "taro"}
+    get_user_from_token(f"Bearer {token}", "pool", with_attributes=False)
+
+    # Cognitoへは問い合わせず、JWKSの取得も1回だけ
+    assert cognito.calls == 0
+    assert len(jwks[1]) == 1
+
+
+def test_verify_access_token_with_attributes(cognito, jwks, rsa_key, monkeypatch):
+    admin_calls = []
+    original = cognito.admin_get_user
+
+    def admin_get_user(**kwargs):
+        admin_calls.append(kwargs)
+        return original(**kwargs)
+
+    monkeypatch.setattr(cognito, "admin_get_user", admin_get_user)
+    token = make_token(rsa_key)
+
+    for _ in range(2):
+        user = get_user_from_token(f"Bearer {token}", "pool")
+        assert user == {
+            "user_id": "taro",
+            "email": "taro@example.com",
+            "role": "admin",
+        }
+    assert len(admin_calls) == 1
+    assert cognito.calls == 0
+
+
+@pytest.mark.parametrize(
+    "claims",
+    [
+        {"exp": int(time.time()) - 1},
+        {"client_id": "other-app"},
+        {"token_use": "id"},
+        {"iss": get_issuer("other-pool")},
+    ],
+)
+def test_verify_access_token_rejects_invalid_claims(cognito, jwks, rsa_key, claims):
+    token = make_token(rsa_key, **claims)
+    with pytest.raises(HTTPException) as e:
+        get_user_from_token(f"Bearer {token}", "pool", with_attributes=False)
+    assert e.value.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_verify_access_token_requires_app_client_ids(
+    cognito, jwks, rsa_key, monkeypatch
+):
+    monkeypatch.setattr(authorization.settings, "cognito_app_client_ids", [])
+    token = make_token(rsa_key)
+    with pytest.raises(HTTPException) as e:
+        get_user_from_token(f"Bearer {token}", "pool", with_attributes=False)
+    assert e.value.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_jwt_mode_settings_require_app_client_ids():
+    values = {**settings.model_dump(), "auth_mode": "jwt"}
+    with pytest.raises(ValidationError):
+        Settings.model_validate({**values, "cognito_app_client_ids": []})
+    assert Settings.model_validate(
+        {**values, "cognito_app_client_ids": ["app"]}
+    ).cognito_app_client_ids == ["app"]
+
+
+def test_verify_access_token_rejects_wrong_signature(cognito, jwks):
+    other_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    token = make_token(other_key)
+    with pytest.raises(HTTPException) as e:
+        get_user_from_token(f"Bearer {token}", "pool", with_attributes=False)
+    assert e.value.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_verify_access_token_key_rotation(cognito, jwks, rsa_key, monkeypatch):
+    keys, fetches = jwks
+    get_user_from_token(f"Bearer {make_token(rsa_key)}", "pool", with_attributes=False)
+
+    # 新しい鍵が追加された場合、未知のkidでJWKSを再取得する
+    new_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    keys["kid-2"] = new_key
+    monkeypatch.setattr(authorization.jwks_cache, "min_refresh_interval", 0)
+    token = make_token(new_key, kid="kid-2")
+
+    user = get_user_from_token(f"Bearer {token}", "pool", with_attributes=False)
+    assert user == {"user_id": "taro"}
+    assert len(fetches) == 2
+
+
+def test_get_user_from_token_async_single_flight(cognito, monkeypatch):
+    original = cognito.get_user
+
+    def slow_get_user(**kwargs):
+        time.sleep(0.1)
+        return original(**kwargs)
+
+    monkeypatch.setattr(cognito, "get_user", slow_get_user)
+
+    async def lookup_concurrently():
+        return await asyncio.gather(
+            *[
+                get_user_from_token_async("Bearer valid-token", "pool")
+                for _ in range(20)
+            ]
+        )
+
+    users = asyncio.run(lookup_concurrently())
+
+    # 同時に届いた20件の問い合わせは、Cognitoへの1回の問い合わせにまとめられる
+    assert cognito.calls == 1
+    assert all(user["user_id"] == "taro" for user in users)
+    assert len(token_lookups) == 0
+
+
+def test_get_cognito_client_is_shared(monkeypatch):
+    created = []
+    monkeypatch.setattr(boto3, "client", lambda name: created.append(name) or object())
+    authorization.get_cognito_client.cache_clear()
+
+    assert authorization.get_cognito_client() is authorization.get_cognito_client()
+    assert created == ["cognito-idp"]
+    authorization.get_cognito_client.cache_clear()
@@ -0,0 +1,132 @@
+import inspect
+import sqlite3
+
+import pytest
+from fastapi import Request, Response
+from sqlalchemy import exc
+
+from cruds import REPLICA_SESSION_INFO
+from dependencies import database
+from dependencies.database import (
+    READ_PRIMARY_COOKIE,
+    InstrumentedQueuePool,
+    ReplicaSet,
+    get_pool_status,
+    get_session,
+    get_sync_session,
+    should_use_replica,
+)
+
+
+def make_request(method: str, headers: dict = {}) -> Request:
+    return Request(
+        {
+            "type": "http",
+            "method": method,
+            "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+        }
+    )
+
+
+@pytest.fixture
+def replica_set(tmp_path, monkeypatch):
+    replica_set = ReplicaSet(
+        [f"sqlite:///{tmp_path}/replica1.db", f"sqlite:///{tmp_path}/replica2.db"],
+        health_check_interval=10,
+    )
+    monkeypatch.setattr(database, "replica_set", replica_set)
+    return replica_set
+
+
+def test_pool_status():
+    pool = InstrumentedQueuePool(
+        lambda: sqlite3.connect(":memory:"), pool_size=1, max_overflow=1, timeout=0.05
+    )
+    first = pool.connect()
+    second = pool.connect()
+
+    status = get_pool_status(pool)
+    assert status["checked_out"] == 2
+    assert status["overflow"] == 1
+    assert status["checkouts"] == 2
+
+    # pool_size + max_overflowを超えるとpool_timeoutだけ待ってタイムアウトします
+    with pytest.raises(exc.TimeoutError):
+        pool.connect()
+    status = get_pool_status(pool)
+    assert status["timeouts"] == 1
+    assert status["wait_seconds_max"] >= 0.05
+
+    first.close()
+    second.close()
+    status = get_pool_status(pool)
+    assert status["checked_out"] == 0
+    assert status["checked_in"] == 1
+
+
+def test_replica_set_round_robin(replica_set, tmp_path):
+    first, second = replica_set.replicas
+    assert [replica_set.choose() for _ in range(3)] == [first, second, first]
+
+    # 正常でないレプリカは選択されず、全て正常でない場合はNoneを返します
+    second.healthy = False
+    assert [replica_set.choose() for _ in range(2)] == [first, first]
+    first.healthy = False
+    assert replica_set.choose() is None
+
+    # ヘルスチェックに成功すると再び選択されます
+    replica_set.check()
+    assert first.healthy and second.healthy
+
+    unreachable = ReplicaSet([f"sqlite:///{tmp_path}/missing/replica.db"], 10)
+    unreachable.check()
+    assert unreachable.choose() is None
+
+
+def test_should_use_replica():
+    assert should_use_replica(make_request("GET"))
+    assert not should_use_replica(make_request("POST"))
+    assert not should_use_replica(make_request("GET", {"X-Read-Your-Writes": "1"}))
+    assert not should_use_replica(
+        make_request("GET", {"Cookie": f"{READ_PRIMARY_COOKIE}=1"})
+    )
+
+
+def test_get_session_is_sync_without_db_async():
+    # 同期のエンジンでは、セッションの終了処理をスレッドプールで実行させるため同期の依存関係にします
+    assert get_session is get_sync_session
+    assert inspect.isgeneratorfunction(get_session)
+
+
+def test_get_session_routing(replica_set):
+    def get_bind(request: Request, response: Response):
+        sessions = get_sync_session(request, response)
+        session = next(sessions)
+        sessions.close()
+        # レプリカのセッションで読み込んだ値は、エンティティキャッシュに書き込まれません
+        assert session.info[REPLICA_SESSION_INFO] == (
+            session.get_bind() is not database.engine
+        )
+        return session.get_bind()
+
+    # 参照はレプリカ、更新はプライマリに接続し、更新後の参照をプライマリで行うCookieを返します
+    response = Response()
+    assert get_bind(make_request("GET"), response) in {
+        replica.engine for replica in replica_set.replicas
+    }
+    assert READ_PRIMARY_COOKIE not in response.headers.get("set-cookie", "")
+
+    response = Response()
+    assert get_bind(make_request("POST"), response) is database.engine
+    assert response.headers["set-cookie"].startswith(f"{READ_PRIMARY_COOKIE}=1")
+
+
+def test_get_session_without_replicas(monkeypatch):
+    monkeypatch.setattr(database, "replica_set", ReplicaSet([], 10))
+
+    # レプリカが無い場合は全てプライマリに接続し、参照をプライマリで行うCookieも返しません
+    response = Response()
+    sessions = get_sync_session(make_request("POST"), response)
+    assert next(sessions).get_bind() is database.engine
+    sessions.close()
+    assert "set-cookie" not in response.headers
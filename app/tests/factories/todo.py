@@ -2,7 +2,6 @@ from factory import Faker, Iterator, SubFactory
 from factory.alchemy import SQLAlchemyModelFactory
 from faker import Faker as OriginalFaker
 
-from dependencies.database import session
 from models.todo import TaskStatus, Todo
 
 from .user import UserFactory
@@ -19,7 +18,7 @@ class TodoFactory(SQLAlchemyModelFactory):
     class Meta:
         model = Todo
         sqlalchemy_session_persistence = "commit"
-        sqlalchemy_session = session
+        # sqlalchemy_sessionは、テスト毎にconftestのdb_sessionで設定する
 
     title = Faker("pystr", max_chars=40, locale="ja_JP")
     """
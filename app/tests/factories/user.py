@@ -1,7 +1,6 @@
 from factory import Faker
 from factory.alchemy import SQLAlchemyModelFactory
 
-from dependencies.database import session
 from models.user import User
 
 
@@ -9,7 +8,7 @@ class UserFactory(SQLAlchemyModelFactory):
     class Meta:
         model = User
         sqlalchemy_session_persistence = "commit"
-        sqlalchemy_session = session
+        # sqlalchemy_sessionは、テスト毎にconftestのdb_sessionで設定する
 
     name = Faker("name")
     email = Faker("email")
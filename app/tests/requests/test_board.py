@@ -0,0 +1,125 @@
+from datetime import datetime, timedelta
+
+from fastapi import status
+
+from models.todo import TaskStatus
+from tests.factories.todo import TodoFactory
+from tests.factories.user import UserFactory
+
+
+def test_read_board(client, db_session, assert_num_queries):
+    alice, bob = UserFactory(), UserFactory()
+    created_at = datetime(2024, 1, 1)
+    todos = [
+        TodoFactory(
+            status=task_status,
+            assignee=assignee,
+            created_at=created_at + timedelta(minutes=i),
+        )
+        for i, (task_status, assignee) in enumerate(
+            [
+                (TaskStatus.TODO, alice),
+                (TaskStatus.TODO, alice),
+                (TaskStatus.TODO, bob),
+                (TaskStatus.DOING, bob),
+            ]
+        )
+    ]
+    db_session.commit()
+    alice_id, bob_id = str(alice.id), str(bob.id)
+    todo_ids = [str(todo.id) for todo in todos]
+    db_session.expunge_all()
+
+    # 集計のクエリと、ウィンドウ関数で先頭のTodoを取得するクエリの2回だけ発行します
+    with assert_num_queries(2):
+        response = client.get("/api/v1/board?limit=2")
+    assert response.status_code == status.HTTP_200_OK
+    todo, doing, done = response.json()["columns"]
+
+    assert todo["status"] == TaskStatus.TODO.value
+    assert todo["count"] == 3
+    assert {item["assignee_id"]: item["count"] for item in todo["assignees"]} == {
+        alice_id: 2,
+        bob_id: 1,
+    }
+    # 各列は作成日時順で先頭のlimit件だけを返します
+    assert [card["id"] for card in todo["cards"]] == todo_ids[:2]
+    assert todo["cards"][0]["assignee"]["id"] == alice_id
+
+    assert doing["count"] == 1
+    assert [card["id"] for card in doing["cards"]] == [todo_ids[3]]
+    assert done == {
+        "status": TaskStatus.DONE.value,
+        "count": 0,
+        "assignees": [],
+        "cards": [],
+    }
+
+
+def read_counts(client):
+    response = client.get("/api/v1/board/counts")
+    assert response.status_code == status.HTTP_200_OK
+    return {
+        column["status"]: (
+            column["count"],
+            {item["assignee_id"]: item["count"] for item in column["assignees"]},
+        )
+        for column in response.json()["columns"]
+    }
+
+
+def test_read_board_counts(client, db_session, assert_num_queries):
+    alice, bob = UserFactory(), UserFactory()
+    db_session.commit()
+    alice_id, bob_id = str(alice.id), str(bob.id)
+
+    todo_ids = [
+        client.post(
+            "/api/v1/todos", json={"title": f"Todo {i}", "assignee_id": assignee_id}
+        ).json()["id"]
+        for i, assignee_id in enumerate([alice_id, alice_id, bob_id, None])
+    ]
+    client.post(
+        "/api/v1/todos:bulk", json=[{"title": "Bulk", "status": 2}, {"title": "Bulk"}]
+    )
+    assert read_counts(client) == {
+        1: (5, {alice_id: 2, bob_id: 1, None: 2}),
+        2: (1, {None: 1}),
+        3: (0, {}),
+    }
+
+    # ステータス・担当者を変更した場合は、変更前から減らし変更後に加算します
+    client.patch(f"/api/v1/todos/{todo_ids[0]}", json={"status": 3})
+    client.patch(f"/api/v1/todos/{todo_ids[3]}", json={"assignee_id": bob_id})
+    client.patch(f"/api/v1/todos?assignee_id={bob_id}", json={"status": 2})
+    client.delete(f"/api/v1/todos/{todo_ids[1]}")
+    client.delete("/api/v1/todos?status=3")
+    db_session.expunge_all()
+
+    # todoテーブルを集計せず、件数のテーブルを1回のクエリで読み込みます
+    with assert_num_queries(1):
+        counts = read_counts(client)
+    assert counts == {1: (1, {None: 1}), 2: (3, {bob_id: 2, None: 1}), 3: (0, {})}
+
+
+def test_reconcile_todo_counts(client, db_session):
+    user = UserFactory()
+    # ファクトリはCRUDを経由しないため、件数のテーブルは更新されません
+    TodoFactory(status=TaskStatus.TODO, assignee=user)
+    TodoFactory(status=TaskStatus.DONE, assignee=None)
+    db_session.commit()
+    user_id = str(user.id)
+    client.post("/api/v1/todos", json={"title": "Todo", "assignee_id": user_id})
+    assert read_counts(client)[1] == (1, {user_id: 1})
+
+    response = client.post("/admin/todo-counts:reconcile")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"corrected": 2}
+    assert read_counts(client) == {
+        1: (2, {user_id: 2}),
+        2: (0, {}),
+        3: (1, {None: 1}),
+    }
+
+    # 差異が無い場合は何も修正しません
+    assert client.post("/admin/todo-counts:reconcile").json() == {"corrected": 0}
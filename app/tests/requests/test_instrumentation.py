@@ -0,0 +1,97 @@
+import json
+import logging
+
+import pytest
+from fastapi import status
+
+import instrumentation
+from config import settings
+from dependencies import database
+from dependencies.database import ReplicaSet, get_session
+from tests.factories.todo import TodoFactory
+
+
+@pytest.fixture
+def instrumented_engine(db_engine):
+    instrumentation.install(db_engine)
+    yield db_engine
+    instrumentation.uninstall(db_engine)
+
+
+@pytest.fixture
+def replica(client, db_engine, test_app, monkeypatch):
+    """
+    テストDBを参照するレプリカを設定し、リクエストのセッションを実際の振り分けに戻します。
+    """
+    replica_set = ReplicaSet([db_engine.url.render_as_string(hide_password=False)], 10)
+    monkeypatch.setattr(database, "replica_set", replica_set)
+    (replica,) = replica_set.replicas
+    for target in replica.sync_engines:
+        instrumentation.install(target)
+    monkeypatch.delitem(test_app.dependency_overrides, get_session)
+    yield replica
+    for target in replica.sync_engines:
+        instrumentation.uninstall(target)
+
+
+def parse_server_timing(value: str) -> dict:
+    metrics = {}
+    for metric in value.split(", "):
+        name, *params = metric.split(";")
+        metrics[name] = dict(param.split("=", 1) for param in params)
+    return metrics
+
+
+def test_server_timing(client, db_session, instrumented_engine, assert_num_queries):
+    TodoFactory()
+    db_session.commit()
+    db_session.expunge_all()
+
+    with assert_num_queries(1):
+        response = client.get("/api/v1/todos")
+    assert response.status_code == status.HTTP_200_OK
+
+    # SQLの件数・時間と、認証・シリアライズ・全体の時間を返します
+    metrics = parse_server_timing(response.headers["Server-Timing"])
+    assert metrics["db"]["desc"] == '"1 queries"'
+    assert set(metrics) == {"db", "auth", "serialize", "total"}
+    assert float(metrics["total"]["dur"]) >= float(metrics["db"]["dur"])
+
+
+def test_server_timing_replica(client, db_session, replica):
+    TodoFactory()
+    db_session.commit()
+
+    # レプリカのエンジンも計測の対象です
+    assert set(replica.sync_engines) <= set(database.sync_engines())
+
+    # レプリカで処理した参照のSQLも件数に含めます
+    response = client.get("/api/v1/todos")
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()) == 1
+    metrics = parse_server_timing(response.headers["Server-Timing"])
+    assert metrics["db"]["desc"] == '"1 queries"'
+
+
+def test_server_timing_disabled(client, monkeypatch):
+    monkeypatch.setattr(settings, "server_timing", False)
+    response = client.get("/api/v1/todos")
+    assert "Server-Timing" not in response.headers
+
+
+def test_slow_query_log(client, db_session, instrumented_engine, monkeypatch, caplog):
+    todo = TodoFactory()
+    db_session.commit()
+    todo_id = todo.id
+    db_session.expunge_all()
+    monkeypatch.setattr(settings, "slow_query_seconds", 0)
+
+    with caplog.at_level(logging.WARNING, logger="slow_query"):
+        client.get(f"/api/v1/todos/{todo_id}")
+
+    # ルートのパスとパラメーターの型(値は含まない)を出力します
+    record = json.loads(caplog.records[-1].getMessage())
+    assert record["event"] == "slow_query"
+    assert record["route"] == "GET /api/v1/todos/{id}"
+    assert str(todo_id.hex) not in json.dumps(record["parameter_shape"])
+    assert record["duration_ms"] >= 0
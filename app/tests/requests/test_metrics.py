@@ -0,0 +1,33 @@
+from uuid import uuid4
+
+from fastapi import status
+from prometheus_client import REGISTRY
+
+
+def request_count(route: str, status_code: int) -> float:
+    value = REGISTRY.get_sample_value(
+        "http_requests_total",
+        {"method": "GET", "route": route, "status": str(status_code)},
+    )
+    return value or 0
+
+
+def test_metrics(client):
+    route = "/api/v1/todos/{id}"
+    before = request_count(route, status.HTTP_404_NOT_FOUND)
+
+    # パスのIDが異なっても、ルートのパスでまとめて記録されます
+    client.get(f"/api/v1/todos/{uuid4()}")
+    client.get(f"/api/v1/todos/{uuid4()}")
+    client.get("/not-found")
+    assert request_count(route, status.HTTP_404_NOT_FOUND) == before + 2
+    assert request_count("<unmatched>", status.HTTP_404_NOT_FOUND) >= 1
+
+    # 管理者用APIはマウント先のパスを含めて記録されます
+    client.get("/admin/cache/stats")
+    assert request_count("/admin/cache/stats", status.HTTP_200_OK) >= 1
+
+    response = client.get("/metrics", headers={"Authorization": ""})
+    assert response.status_code == status.HTTP_200_OK
+    assert "http_request_duration_seconds_bucket" in response.text
+    assert 'http_requests_in_progress{method="GET"}' in response.text
@@ -0,0 +1,57 @@
+import pytest
+from fastapi import status
+
+from query_plans import analyze_plan, query_plan_advisor
+from tests.factories.todo import TodoFactory
+
+
+@pytest.fixture
+def advisor(db_engine, monkeypatch):
+    monkeypatch.setattr(query_plan_advisor, "enabled", True)
+    monkeypatch.setattr(query_plan_advisor, "engine", db_engine)
+    query_plan_advisor.install(db_engine)
+    yield query_plan_advisor
+    query_plan_advisor.uninstall(db_engine)
+    query_plan_advisor.clear()
+
+
+def test_analyze_plan():
+    plan = [
+        {"table": "todo", "type": "ALL", "Extra": "Using where; Using filesort"},
+        {"table": "user", "type": "eq_ref", "Extra": None},
+    ]
+    assert analyze_plan(plan) == {
+        "full_scans": ["todo"],
+        "filesorts": ["todo"],
+        "temporary_tables": [],
+    }
+
+
+def test_read_query_plans(client, db_session, advisor):
+    todo = TodoFactory()
+    db_session.commit()
+    todo_id, assignee_id = todo.id, todo.assignee_id
+    db_session.expunge_all()
+
+    client.get(f"/api/v1/todos?assignee_id={assignee_id}")
+    client.get(f"/api/v1/todos?assignee_id={assignee_id}")
+    client.get(f"/api/v1/todos/{todo_id}")
+
+    response = client.get("/admin/query-plans")
+    assert response.status_code == status.HTTP_200_OK
+    report = response.json()
+    # ルートのパス毎に、重複を除いたSQLと実行計画が記録されます
+    assert set(report) == {"GET /api/v1/todos", "GET /api/v1/todos/{id}"}
+    assert len(report["GET /api/v1/todos"]) == 1
+    entry = report["GET /api/v1/todos"][0]
+    assert "todo.assignee_id" in entry["statement"]
+    assert {"full_scans", "filesorts", "temporary_tables", "plan"} <= set(entry)
+
+    response = client.delete("/admin/query-plans")
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert client.get("/admin/query-plans").json() == {}
+
+
+def test_read_query_plans_disabled(client):
+    response = client.get("/admin/query-plans")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
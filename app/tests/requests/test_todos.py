@@ -1,10 +1,20 @@
+import csv
+import io
+import json
+from datetime import datetime
 from itertools import cycle
+from uuid import uuid4
 
+import pytest
 from fastapi import status
 from sqlmodel import func, select
 
+import models
+from config import settings
+from cruds import REPLICA_SESSION_INFO
 from models.todo import TaskStatus, Todo
 from tests.factories.todo import TodoFactory
+from tests.factories.user import UserFactory
 
 
 def test_read_todos(client, db_session):
@@ -34,15 +44,153 @@ def test_read_todos(client, db_session):
     data = response.json()
 
     count_statement = (
-        select(func.count()).select_from(Todo).where(Todo.status == filter_status)
+        select(func.count())
+        .select_from(Todo)
+        .where(Todo.status == TaskStatus(filter_status))
     )
     total = db_session.exec(count_statement).one()
 
     assert len(data) == total
+    assert total > 0
 
     for item in data:
         assert item["status"] == filter_status
 
+    # ステータスは名前でも指定できます
+    response = client.get("/api/v1/todos?status=TODO")
+    assert len(response.json()) == total
+
+
+def test_read_todos_num_queries(client, db_session, assert_num_queries):
+    todos = [TodoFactory() for _ in range(10)]
+    db_session.add_all(todos)
+    db_session.commit()
+    todo_id, assignee_id = todos[0].id, todos[0].assignee_id
+    # セッションに読み込み済みのUserを使わないように、セッションを空にします
+    db_session.expunge_all()
+
+    # 担当者・作成者・更新者はJOINで読み込まれ、クエリは1回だけ発行されます
+    with assert_num_queries(1):
+        response = client.get("/api/v1/todos")
+    assert response.status_code == status.HTTP_200_OK
+    for item in response.json():
+        assert item["assignee"] is not None
+        assert item["creator"] is not None
+        assert item["updater"] is not None
+
+    db_session.expunge_all()
+    with assert_num_queries(1):
+        response = client.get(f"/api/v1/todos/{todo_id}")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["assignee"]["id"] == str(assignee_id)
+
+
+def test_read_todos_with_fields(client, db_session, assert_num_queries):
+    todos = [TodoFactory() for _ in range(3)]
+    db_session.add_all(todos)
+    db_session.commit()
+    db_session.expunge_all()
+
+    with assert_num_queries(1):
+        response = client.get("/api/v1/todos?fields=title,status&include=assignee")
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    assert len(data) == len(todos)
+    for item in data:
+        assert set(item) == {"id", "title", "status", "assignee"}
+        assert item["assignee"]["id"] is not None
+
+
+def test_read_todos_with_fields_and_cursor(client, db_session, assert_num_queries):
+    todos = [TodoFactory() for _ in range(3)]
+    db_session.add_all(todos)
+    db_session.commit()
+    db_session.expunge_all()
+
+    # 次ページのカーソルに使用するcreated_atも同じクエリで読み込まれます
+    with assert_num_queries(1):
+        response = client.get("/api/v1/todos?fields=title&include=&limit=2")
+    assert response.status_code == status.HTTP_200_OK
+    assert [set(item) for item in response.json()] == [{"id", "title"}] * 2
+    cursor = response.headers["X-Next-Cursor"]
+
+    db_session.expunge_all()
+    with assert_num_queries(1):
+        response = client.get(
+            "/api/v1/todos", params={"fields": "title", "include": "", "cursor": cursor}
+        )
+    assert len(response.json()) == 1
+
+
+def test_read_todos_fast_json_response(client, db_session, monkeypatch):
+    todos = [TodoFactory() for _ in range(5)]
+    db_session.add_all(todos)
+    db_session.commit()
+    todo_id = todos[0].id
+
+    response = client.get("/api/v1/todos")
+    expected = response.json()
+    expected_todo = client.get(f"/api/v1/todos/{todo_id}").json()
+
+    # 事前に作成したTypeAdapterでシリアライズしても、レスポンスは変わりません
+    monkeypatch.setattr(settings, "fast_json_response", True)
+    response = client.get("/api/v1/todos")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"] == "application/json"
+    assert response.json() == expected
+    assert client.get(f"/api/v1/todos/{todo_id}").json() == expected_todo
+
+
+def test_read_todos_with_cursor(client, db_session):
+    cnt = 5
+    todos = [TodoFactory() for _ in range(cnt)]
+    db_session.add_all(todos)
+    db_session.commit()
+
+    # X-Next-Cursorヘッダーのカーソルを辿って全件取得します
+    ids = []
+    response = client.get("/api/v1/todos?limit=2")
+    while True:
+        assert response.status_code == status.HTTP_200_OK
+        ids += [item["id"] for item in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        response = client.get("/api/v1/todos", params={"limit": 2, "cursor": cursor})
+
+    assert len(ids) == cnt
+    assert set(ids) == {str(todo.id) for todo in todos}
+
+    # オフセット指定でも同じ順序で取得できることを確認します
+    response = client.get("/api/v1/todos?offset=2&limit=2")
+    assert [item["id"] for item in response.json()] == ids[2:4]
+
+
+def test_read_todos_with_invalid_cursor(client):
+    response = client.get("/api/v1/todos?cursor=invalid")
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_export_todos(client, db_session):
+    todos = [TodoFactory(status=TaskStatus.DOING) for _ in range(3)]
+    TodoFactory(status=TaskStatus.DONE)
+    db_session.commit()
+    ids = {str(todo.id) for todo in todos}
+
+    response = client.get("/api/v1/todos/export?status=DOING")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert {row["id"] for row in rows} == ids
+    assert all(row["status"] == TaskStatus.DOING.value for row in rows)
+
+    response = client.get("/api/v1/todos/export?format=csv&status=DOING")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert {row["id"] for row in rows} == ids
+    assert all(row["title"] for row in rows)
+
 
 def test_read_todo(client, db_session):
     # テスト用のTodoを作成します
@@ -65,6 +213,169 @@ def test_read_todo(client, db_session):
     assert data["status"] == todo.status.value
 
 
+def test_read_todo_etag(client, db_session):
+    todo = TodoFactory(updated_at=datetime(2024, 1, 1))
+    db_session.commit()
+    todo_id = todo.id
+
+    response = client.get(f"/api/v1/todos/{todo_id}")
+    assert response.status_code == status.HTTP_200_OK
+    etag = response.headers["ETag"]
+
+    response = client.get(f"/api/v1/todos/{todo_id}", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.headers["ETag"] == etag
+    response = client.get(
+        f"/api/v1/todos/{todo_id}", headers={"If-None-Match": f'"other", W/{etag}'}
+    )
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    # 更新するとrevisionが変わり、ETagが一致しなくなります
+    client.patch(f"/api/v1/todos/{todo_id}", json={"title": "Updated"})
+    response = client.get(f"/api/v1/todos/{todo_id}", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["title"] == "Updated"
+    assert response.headers["ETag"] != etag
+
+
+def test_read_todo_etag_same_second(client, db_session, monkeypatch):
+    class FrozenDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime(2024, 1, 2, 3, 4, 5, tzinfo=tz)
+
+    # 更新日時が同じ秒のままでも、更新毎にETagが変わります
+    monkeypatch.setattr(models, "datetime", FrozenDatetime)
+    todo = TodoFactory()
+    db_session.commit()
+    todo_id = todo.id
+
+    etag = client.get(f"/api/v1/todos/{todo_id}").headers["ETag"]
+    for title in ["First", "Second"]:
+        client.patch(f"/api/v1/todos/{todo_id}", json={"title": title})
+        response = client.get(
+            f"/api/v1/todos/{todo_id}", headers={"If-None-Match": etag}
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["title"] == title
+        assert response.json()["updated_at"] == "2024-01-02 03:04:05"
+        assert response.headers["ETag"] != etag
+        etag = response.headers["ETag"]
+
+
+@pytest.mark.parametrize("cached", [False, True])
+def test_read_todo_etag_related_user_renamed(client, db_session, request, cached):
+    if cached:
+        # キャッシュしたTodoも、埋め込まれた担当者の更新で無効化されます
+        request.getfixturevalue("entity_cache")
+    todo = TodoFactory()
+    db_session.commit()
+    todo_id, assignee_id = todo.id, todo.assignee_id
+
+    etag = client.get(f"/api/v1/todos/{todo_id}").headers["ETag"]
+
+    # 埋め込まれた担当者が更新されると、Todoが変わらなくてもETagが変わります
+    client.patch(f"/api/v1/users/{assignee_id}", json={"name": "Renamed"})
+    response = client.get(f"/api/v1/todos/{todo_id}", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["assignee"]["name"] == "Renamed"
+
+    # 担当者を含めない表現のETagは、担当者の更新では変わりません
+    etag = client.get(f"/api/v1/todos/{todo_id}?include=").headers["ETag"]
+    client.patch(f"/api/v1/users/{assignee_id}", json={"name": "Renamed again"})
+    response = client.get(
+        f"/api/v1/todos/{todo_id}?include=", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+
+def test_read_todo_cached_creator_deleted(client, db_session, entity_cache):
+    creator = UserFactory()
+    todo = TodoFactory(creator=creator)
+    db_session.commit()
+    todo_id, creator_id = todo.id, creator.id
+
+    assert client.get(f"/api/v1/todos/{todo_id}").json()["creator"]["id"] == str(
+        creator_id
+    )
+
+    # 作成者が削除されると、キャッシュしたTodoからも作成者が無くなります
+    response = client.delete(f"/api/v1/users/{creator_id}")
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert client.get(f"/api/v1/todos/{todo_id}").json()["creator"] is None
+
+
+def test_read_todo_from_replica_not_cached(client, db_session, entity_cache):
+    todo = TodoFactory()
+    db_session.commit()
+    todo_id = todo.id
+
+    # レプリカのセッションで読み込んだ値は、遅延している場合があるためキャッシュしません
+    db_session.info[REPLICA_SESSION_INFO] = True
+    try:
+        assert client.get(f"/api/v1/todos/{todo_id}").status_code == status.HTTP_200_OK
+        assert len(entity_cache) == 0
+    finally:
+        del db_session.info[REPLICA_SESSION_INFO]
+
+    client.get(f"/api/v1/todos/{todo_id}")
+    assert len(entity_cache) == 1
+
+
+def test_read_todo_etag_cached(client, db_session, entity_cache):
+    todo = TodoFactory()
+    db_session.commit()
+    todo_id = todo.id
+
+    # キャッシュから返した場合も、内容から作成したETagで304を返します
+    etag = client.get(f"/api/v1/todos/{todo_id}").headers["ETag"]
+    response = client.get(f"/api/v1/todos/{todo_id}", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert entity_cache.stats()["hits"] == 1
+
+    client.patch(f"/api/v1/todos/{todo_id}", json={"title": "Updated"})
+    response = client.get(f"/api/v1/todos/{todo_id}", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["title"] == "Updated"
+
+
+def test_read_todo_cached(client, db_session, entity_cache, assert_num_queries):
+    todo = TodoFactory()
+    other = UserFactory()
+    db_session.commit()
+    todo_id, assignee_id, other_id = todo.id, todo.assignee_id, other.id
+
+    response = client.get(f"/api/v1/todos/{todo_id}")
+    assert response.status_code == status.HTTP_200_OK
+    assert client.get(f"/api/v1/users/{assignee_id}/todos").json()[0]["id"] == str(
+        todo_id
+    )
+
+    # 2回目以降はキャッシュから返され、クエリは発行されません
+    with assert_num_queries(0):
+        assert client.get(f"/api/v1/todos/{todo_id}").json() == response.json()
+        assert len(client.get(f"/api/v1/users/{assignee_id}/todos").json()) == 1
+    assert entity_cache.stats()["hits"] == 2
+
+    # 更新するとキャッシュが無効化され、変更前後の担当者の一覧にも反映されます
+    response = client.patch(
+        f"/api/v1/todos/{todo_id}",
+        json={"title": "Updated", "assignee_id": str(other_id)},
+    )
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    data = client.get(f"/api/v1/todos/{todo_id}").json()
+    assert data["title"] == "Updated"
+    assert data["assignee"]["id"] == str(other_id)
+    assert client.get(f"/api/v1/users/{assignee_id}/todos").json() == []
+    assert len(client.get(f"/api/v1/users/{other_id}/todos").json()) == 1
+
+    response = client.delete(f"/api/v1/todos/{todo_id}")
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    response = client.get(f"/api/v1/todos/{todo_id}")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert client.get(f"/api/v1/users/{other_id}/todos").json() == []
+
+
 def test_create_todo(client):
     # テストデータを作成します
     todo_data = {"title": "Test Todo", "description": "This is a test todo"}
@@ -79,6 +390,57 @@ def test_create_todo(client):
     assert data["status"] == 1
 
 
+def test_create_todo_without_refresh(client, capture_queries, monkeypatch):
+    now = datetime(2024, 1, 2, 3, 4, 5)
+
+    class FrozenDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return now.replace(tzinfo=tz)
+
+    # 作成日時・更新日時はimport時ではなく、作成する行毎に生成されます
+    monkeypatch.setattr(models, "datetime", FrozenDatetime)
+    with capture_queries() as statements:
+        response = client.post("/api/v1/todos", json={"title": "Test Todo"})
+
+    assert response.status_code == status.HTTP_201_CREATED
+    data = response.json()
+    assert data["created_at"] == data["updated_at"] == now.isoformat()
+    # コミット後に作成したTodoを読み込み直すSELECTは発行されません
+    assert not any(s.lstrip().upper().startswith("SELECT") for s in statements)
+
+
+def test_bulk_create_todos(client, db_session, capture_queries):
+    todos_data = [{"title": f"Bulk Todo {i}", "status": 2} for i in range(5)]
+    todos_data.insert(2, {"description": "タイトルがありません"})
+
+    with capture_queries() as statements:
+        response = client.post("/api/v1/todos:bulk?batch_size=2", json=todos_data)
+
+    assert response.status_code == status.HTTP_200_OK
+    results = response.json()
+    assert [result["index"] for result in results] == list(range(6))
+    assert results[2]["id"] is None
+    assert results[2]["errors"][0]["loc"] == ["title"]
+
+    created_ids = [result["id"] for result in results if result["id"] is not None]
+    assert len(created_ids) == 5
+
+    # 2件ずつ3回のINSERTで作成され、作成後のSELECTは発行されません
+    inserts = [
+        s for s in statements if s.lstrip().upper().startswith("INSERT INTO TODO ")
+    ]
+    assert len(inserts) == 3
+    # ステータス・担当者毎の件数は、1回のINSERT(既存の行には加算)でまとめて更新します
+    assert len([s for s in statements if "todo_status_count" in s]) == 1
+    assert not any(s.lstrip().upper().startswith("SELECT") for s in statements)
+
+    count_statement = (
+        select(func.count()).select_from(Todo).where(Todo.status == TaskStatus.DOING)
+    )
+    assert db_session.exec(count_statement).one() == 5
+
+
 def test_update_todo(client, db_session):
     # テスト用のTodoを作成します
     todo = TodoFactory()
@@ -101,6 +463,67 @@ def test_update_todo(client, db_session):
     assert updated_todo.status.value == updated_todo_data["status"]
 
 
+def test_update_todo_num_queries(client, db_session, assert_num_queries):
+    todo = TodoFactory()
+    db_session.commit()
+    todo_id = todo.id
+    db_session.expunge_all()
+
+    # 事前のSELECTと更新後のrefreshは行わず、UPDATEの1回だけが発行されます
+    with assert_num_queries(1):
+        response = client.patch(f"/api/v1/todos/{todo_id}", json={"title": "Updated"})
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert db_session.get(Todo, todo_id).title == "Updated"
+
+
+def test_update_todo_not_found(client):
+    response = client.patch(f"/api/v1/todos/{uuid4()}", json={"title": "Updated"})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_bulk_update_todos(client, db_session):
+    user = UserFactory()
+    updated_at = datetime(2024, 1, 1)
+    doing = [
+        TodoFactory(status=TaskStatus.DOING, assignee=user, updated_at=updated_at)
+        for _ in range(3)
+    ]
+    other = TodoFactory(status=TaskStatus.DOING)
+    db_session.commit()
+
+    response = client.patch(
+        f"/api/v1/todos?status=DOING&assignee_id={user.id}", json={"status": 3}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"count": 3}
+
+    db_session.expire_all()
+    for todo in doing:
+        assert todo.status == TaskStatus.DONE
+        assert todo.updated_at > updated_at
+    assert other.status == TaskStatus.DOING
+
+
+def test_bulk_update_todos_without_filter(client):
+    response = client.patch("/api/v1/todos", json={"status": 3})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_bulk_delete_todos(client, db_session):
+    done = [TodoFactory(status=TaskStatus.DONE) for _ in range(3)]
+    todo = TodoFactory(status=TaskStatus.TODO)
+    db_session.commit()
+    done_ids = [item.id for item in done]
+
+    response = client.delete("/api/v1/todos?status=3")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"count": 3}
+
+    db_session.expire_all()
+    assert all(db_session.get(Todo, id) is None for id in done_ids)
+    assert db_session.get(Todo, todo.id) is not None
+
+
 def test_delete_todo(client, db_session):
     # テスト用のTodoを作成します
     todo = TodoFactory()
@@ -116,3 +539,37 @@ def test_delete_todo(client, db_session):
     # データベースからTodoが削除されたかをチェックします
     deleted_todo = db_session.get(Todo, todo.id)
     assert deleted_todo is None
+
+
+def test_search_todos(client, db_session):
+    minutes = TodoFactory(
+        title="会議資料の作成", description="来週の会議の資料", status=TaskStatus.TODO
+    )
+    printing = TodoFactory(title="資料の印刷", description="", status=TaskStatus.DONE)
+    notes = TodoFactory(title="議事録の共有", description="", status=TaskStatus.TODO)
+    db_session.commit()
+
+    def search(**params):
+        response = client.get("/api/v1/todos/search", params=params)
+        assert response.status_code == status.HTTP_200_OK
+        return [todo["id"] for todo in response.json()]
+
+    # 語を多く含むTodoほど上位になります
+    assert search(q="資料") == [str(minutes.id), str(printing.id)]
+    # 空白で区切った全ての語を含むTodoだけを返します
+    assert search(q="会議 資料") == [str(minutes.id)]
+    # 語は連続した部分文字列として一致します
+    assert search(q="議資料") == [str(minutes.id)]
+    assert search(q="録") == [str(notes.id)]
+    assert search(q="資料", status="DONE") == [str(printing.id)]
+    assert search(q="資料", limit=1, offset=1) == [str(printing.id)]
+    assert search(q="存在しない") == []
+
+    # 更新したTodoは検索結果に反映されます
+    client.patch(f"/api/v1/todos/{notes.id}", json={"title": "議事録と資料の共有"})
+    assert set(search(q="資料")) == {str(minutes.id), str(printing.id), str(notes.id)}
+
+
+def test_search_todos_without_query(client):
+    response = client.get("/api/v1/todos/search")
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
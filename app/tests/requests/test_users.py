@@ -1,5 +1,11 @@
+from datetime import datetime
+
+import pytest
 from fastapi import status
+from sqlmodel import select
 
+import models
+from models.user import User
 from tests.factories.todo import TodoFactory
 from tests.factories.user import UserFactory
 
@@ -15,6 +21,32 @@ def test_create_user(auth_headers, client, db_session):
     assert response.json()["email"] == "john.doe@example.com"
 
 
+def test_bulk_create_users(client, db_session):
+    existing = UserFactory()
+    db_session.commit()
+
+    users_data = [
+        {"name": "Taro", "email": "taro@example.com"},
+        {"name": "Hanako", "email": "not-an-email"},
+        {"name": "Jiro", "email": existing.email},
+        {"name": "Saburo", "email": "saburo@example.com"},
+    ]
+    response = client.post("/api/v1/users:bulk", json=users_data)
+
+    assert response.status_code == status.HTTP_200_OK
+    results = response.json()
+    assert results[0]["id"] is not None
+    assert results[1]["errors"][0]["loc"] == ["email"]
+    # メールアドレスの重複はDBの制約違反として、その要素だけが失敗します
+    assert results[2]["errors"][0]["type"] == "integrity_error"
+    assert results[3]["id"] is not None
+
+    emails = db_session.exec(select(User.email)).all()
+    assert sorted(emails) == sorted(
+        [existing.email, "taro@example.com", "saburo@example.com"]
+    )
+
+
 def test_read_users(client, db_session):
     cnt = 5
     users = [UserFactory() for _ in range(cnt)]
@@ -37,6 +69,65 @@ def test_read_users(client, db_session):
     assert len(users_data) == cnt
 
 
+def test_read_users_with_fields(client, db_session, assert_num_queries):
+    users = [UserFactory() for _ in range(3)]
+    for user in users:
+        TodoFactory(assignee=user, creator=user, updater=user)
+    db_session.commit()
+    user_id, email = users[0].id, users[0].email
+    db_session.expunge_all()
+
+    # 既定では担当のTodo一覧だけを読み込みます(Userと担当Todoの2回)
+    with assert_num_queries(2):
+        response = client.get("/api/v1/users")
+    assert response.status_code == status.HTTP_200_OK
+    assert all(len(user["assigned_todos"]) == 1 for user in response.json())
+
+    # リレーションを指定しない場合、クエリは1回だけ発行されます
+    db_session.expunge_all()
+    with assert_num_queries(1):
+        response = client.get("/api/v1/users?fields=name&include=")
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()) == len(users)
+    for user in response.json():
+        assert set(user) == {"id", "name"}
+
+    db_session.expunge_all()
+    with assert_num_queries(1):
+        response = client.get(f"/api/v1/users/{user_id}?include=")
+    assert response.status_code == status.HTTP_200_OK
+    assert "assigned_todos" not in response.json()
+    assert response.json()["email"] == email
+
+
+def test_read_users_with_unknown_fields(client):
+    response = client.get("/api/v1/users?fields=password")
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    response = client.get("/api/v1/users?include=created_todos")
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_read_users_with_cursor(client, db_session):
+    cnt = 5
+    users = [UserFactory() for _ in range(cnt)]
+    db_session.add_all(users)
+    db_session.commit()
+
+    ids = []
+    response = client.get("/api/v1/users?limit=2")
+    while True:
+        assert response.status_code == status.HTTP_200_OK
+        ids += [user["id"] for user in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        response = client.get("/api/v1/users", params={"limit": 2, "cursor": cursor})
+
+    assert len(ids) == cnt
+    assert set(ids) == {str(user.id) for user in users}
+
+
 def test_read_user(client, db_session):
     user = UserFactory()
     cnt = 5
@@ -77,7 +168,7 @@ def test_delete_user(client, db_session):
     assert response.status_code == status.HTTP_204_NO_CONTENT
 
 
-def test_get_user_todos(client, db_session):
+def test_get_user_todos(client, db_session, assert_num_queries):
     user = UserFactory()
     cnt = 5
     for _ in range(cnt):
@@ -88,7 +179,126 @@ def test_get_user_todos(client, db_session):
     todos = response.json()
 
     assert len(todos) == cnt  # 作成したTodoの数と一致することを確認
+
+    db_session.expunge_all()
+    with assert_num_queries(1):
+        response = client.get(f"/api/v1/users/{user.id}/todos")
+    assert response.status_code == status.HTTP_200_OK
     # for todo in todos:
     #     assert todo["assignee_id"] == str(
     #         user.id
     #     )  # Todoが正しいユーザーに割り当てられていることを確認
+
+
+def test_get_user_todos_etag(client, db_session, assert_num_queries):
+    user = UserFactory()
+    for _ in range(3):
+        TodoFactory(assignee=user)
+    user_id = user.id
+
+    response = client.get(f"/api/v1/users/{user_id}/todos")
+    etag = response.headers["ETag"]
+
+    # 一致する場合は集計クエリだけを発行し、一覧を読み込まずに304を返します
+    db_session.expunge_all()
+    with assert_num_queries(1):
+        response = client.get(
+            f"/api/v1/users/{user_id}/todos", headers={"If-None-Match": etag}
+        )
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.headers["ETag"] == etag
+    assert response.content == b""
+
+    # 取得する項目が異なる場合は、別のETagになります
+    response = client.get(f"/api/v1/users/{user_id}/todos?fields=title")
+    assert response.headers["ETag"] != etag
+
+    # Todoが追加されると一致しなくなり、一覧を返します
+    TodoFactory(assignee=db_session.get(User, user_id))
+    response = client.get(
+        f"/api/v1/users/{user_id}/todos", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()) == 4
+    assert response.headers["ETag"] != etag
+
+
+@pytest.mark.parametrize("cached", [False, True])
+def test_get_user_todos_etag_related_user_renamed(client, db_session, request, cached):
+    if cached:
+        # キャッシュした一覧も、Todoに埋め込まれた作成者の更新で無効化されます
+        request.getfixturevalue("entity_cache")
+    user, creator = UserFactory(), UserFactory()
+    TodoFactory(assignee=user, creator=creator)
+    db_session.commit()
+    user_id, creator_id = user.id, creator.id
+
+    etag = client.get(f"/api/v1/users/{user_id}/todos").headers["ETag"]
+
+    # Todoに埋め込まれた作成者が更新されると、一覧のETagも変わります
+    client.patch(f"/api/v1/users/{creator_id}", json={"name": "Renamed"})
+    response = client.get(
+        f"/api/v1/users/{user_id}/todos", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()[0]["creator"]["name"] == "Renamed"
+    etag = response.headers["ETag"]
+
+    response = client.get(
+        f"/api/v1/users/{user_id}/todos", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+
+def test_get_user_todos_etag_same_second(client, db_session, monkeypatch):
+    class FrozenDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime(2024, 1, 2, 3, 4, 5, tzinfo=tz)
+
+    monkeypatch.setattr(models, "datetime", FrozenDatetime)
+    user = UserFactory()
+    todo = TodoFactory(assignee=user)
+    db_session.commit()
+    user_id, todo_id = user.id, todo.id
+
+    # 件数と更新日時の最大値が同じでも、同じ秒の更新毎にETagが変わります
+    etag = client.get(f"/api/v1/users/{user_id}/todos").headers["ETag"]
+    for title in ["First", "Second"]:
+        client.patch(f"/api/v1/todos/{todo_id}", json={"title": title})
+        response = client.get(
+            f"/api/v1/users/{user_id}/todos", headers={"If-None-Match": etag}
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()[0]["title"] == title
+        assert response.headers["ETag"] != etag
+        etag = response.headers["ETag"]
+
+
+def test_read_user_cached(client, db_session, entity_cache, assert_num_queries):
+    user = UserFactory()
+    db_session.commit()
+    user_id = user.id
+
+    response = client.get(f"/api/v1/users/{user_id}")
+    assert response.status_code == status.HTTP_200_OK
+    with assert_num_queries(0):
+        assert client.get(f"/api/v1/users/{user_id}").json() == response.json()
+
+    # 担当Todoの作成で、ユーザーの担当Todo一覧のキャッシュも無効化されます
+    response = client.post(
+        "/api/v1/todos",
+        json={"title": "New", "description": "New", "assignee_id": str(user_id)},
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    data = client.get(f"/api/v1/users/{user_id}").json()
+    assert [todo["title"] for todo in data["assigned_todos"]] == ["New"]
+
+    response = client.patch(f"/api/v1/users/{user_id}", json={"name": "Updated"})
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert client.get(f"/api/v1/users/{user_id}").json()["name"] == "Updated"
+
+    stats = client.get("/admin/cache/stats").json()
+    assert stats["enabled"] is True
+    assert stats["hits"] == 1
+    assert stats["misses"] == 3
@@ -0,0 +1,22 @@
+from benchmarks.api import SCENARIOS, make_engine, run
+from benchmarks.seed import seed
+from main import admin_api, app
+
+
+def test_api_benchmark_runs_every_scenario(tmp_path):
+    engine = make_engine(f"sqlite:///{tmp_path / 'benchmark.db'}")
+    seed(engine, users=5, todos=50)
+    overrides = dict(app.dependency_overrides)
+    admin_overrides = dict(admin_api.dependency_overrides)
+
+    result = run(engine, requests=3, warmup=1, concurrency=2, writes=True)
+
+    assert app.dependency_overrides == overrides
+    assert admin_api.dependency_overrides == admin_overrides
+    assert result["meta"]["database"] == "sqlite"
+    assert result["meta"]["todos"] == 50
+    assert sorted(result["results"]) == sorted(scenario.name for scenario in SCENARIOS)
+    assert any(name.startswith("GET /admin/") for name in result["results"])
+    for name, summary in result["results"].items():
+        assert summary["requests"] == 3, name
+        assert summary["errors"] == 0, name
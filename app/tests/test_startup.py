@@ -0,0 +1,18 @@
+from benchmarks.startup import format_report, measure
+from config import settings
+
+# ワーカーの起動時には読み込まず、最初に使用する時に読み込むモジュール
+LAZY_MODULES = ["boto3", "botocore", "jwt", "sqlalchemy.dialects.sqlite"]
+
+
+def test_import_time_within_budget():
+    times = measure("main", repeat=3)
+    seconds = times["main"][1] / 1_000_000
+    assert seconds <= settings.import_time_budget_seconds, format_report(
+        times, "main", top=20
+    )
+
+
+def test_heavy_dependencies_are_imported_lazily():
+    times = measure("main", repeat=1)
+    assert [module for module in LAZY_MODULES if module in times] == []